@@ -0,0 +1,464 @@
+# Description: Benchmarks for DirectedGraph and UndirectedGraph on seeded synthetic graphs
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from d_graph import DirectedGraph, LandmarkIndex
+from ud_graph import UndirectedGraph
+
+#sizes (number of vertices) benchmarked when none are given on the command line
+DEFAULT_SIZES = (100, 500, 1000)
+#fraction by which a timing may exceed the baseline before compare() reports it
+DEFAULT_THRESHOLD = 0.25
+#noise floor: compare() ignores changes smaller than this many seconds or bytes, however
+#large they are as a fraction, since timings this short vary run to run
+DEFAULT_MIN_SECONDS = 0.002
+DEFAULT_MIN_BYTES = 64 * 1024
+#number of timed runs per case; results record their median
+DEFAULT_REPEAT = 5
+#number of traversal / shortest path sources sampled from each graph
+QUERIES = 5
+
+
+# ------------------------------------------------------------------ #
+# Generators. Each returns a list of (src, dst, weight) tuples over vertices 0 to n - 1 and
+# gives the same graph for the same arguments
+
+def erdos_renyi(n: int, degree=4, seed=0) -> []:
+    """
+    Random graph with about n * degree edges, each between two uniformly chosen vertices
+    """
+    rnd = random.Random(seed)
+    edges = set()
+    target = min(n * degree, n * (n - 1))
+    while len(edges) < target:
+        u, v = rnd.randrange(n), rnd.randrange(n)
+        if u != v:
+            edges.add((u, v))
+    return [(u, v, rnd.randint(1, 20)) for u, v in sorted(edges)]
+
+
+def power_law(n: int, degree=4, seed=0) -> []:
+    """
+    Preferential attachment (Barabasi-Albert) graph: each new vertex links to about degree
+    earlier vertices chosen in proportion to their degree, giving a few high-degree hubs
+    """
+    rnd = random.Random(seed)
+    #every vertex appears here once per edge end, so a uniform pick is degree-weighted
+    ends = []
+    edges = []
+    for v in range(1, n):
+        targets = set()
+        for _ in range(min(degree, v)):
+            targets.add(rnd.choice(ends) if len(ends) != 0 and rnd.random() < 0.9 else rnd.randrange(v))
+        for u in sorted(targets):
+            edges.append((v, u, rnd.randint(1, 20)))
+            ends.extend((u, v))
+    return edges
+
+
+def grid(n: int, degree=4, seed=0) -> []:
+    """
+    Road-like graph: a square grid of about n vertices with edges both ways between
+    neighboring cells and weights that vary a little around 10. degree is ignored
+    """
+    rnd = random.Random(seed)
+    side = max(1, math.isqrt(n))
+    edges = []
+    for row in range(side):
+        for col in range(side):
+            v = row * side + col
+            for u in ((v + 1) if col + 1 < side else None, (v + side) if row + 1 < side else None):
+                if u is not None:
+                    edges.append((v, u, rnd.randint(8, 12)))
+                    edges.append((u, v, rnd.randint(8, 12)))
+    return edges
+
+
+def dag(n: int, degree=4, seed=0) -> []:
+    """
+    Random acyclic graph: every edge goes from a lower to a higher numbered vertex
+    """
+    rnd = random.Random(seed)
+    edges = set()
+    target = min(n * degree, n * (n - 1) // 2)
+    while len(edges) < target:
+        u, v = rnd.randrange(n), rnd.randrange(n)
+        if u != v:
+            edges.add((min(u, v), max(u, v)))
+    return [(u, v, rnd.randint(1, 20)) for u, v in sorted(edges)]
+
+
+GENERATORS = {'erdos_renyi': erdos_renyi, 'power_law': power_law, 'grid': grid, 'dag': dag}
+
+
+def calibrate() -> int:
+    """
+    A fixed pure-Python workload (about a millisecond) timed alongside every group of cases.
+    Its median time measures how fast the machine was during a run, so compare() can tell a
+    slower machine from slower code
+    """
+    table = dict()
+    for i in range(5000):
+        table[i % 257] = table.get(i % 257, 0) + i
+    return sum(sorted(table.values()))
+
+
+# ------------------------------------------------------------------ #
+
+def measure(functions, repeat=DEFAULT_REPEAT) -> []:
+    """
+    Times each function repeat times and returns one (median time in seconds, peak bytes
+    allocated by Python during one run) pair per function. The timed runs are interleaved,
+    one run of every function per round, so a stretch where the machine is slow adds a
+    little to every median instead of a lot to one. As in timeit, the garbage collector is
+    off during timed runs, so a collection of earlier cases' garbage is not charged to
+    whichever case happens to trigger it. Memory is traced in separate runs so tracing does
+    not slow down the timed ones
+    """
+    times = [[] for _ in functions]
+    enabled = gc.isenabled()
+    try:
+        for _ in range(repeat):
+            for function, samples in zip(functions, times):
+                gc.collect()
+                gc.disable()
+                start = time.perf_counter()
+                function()
+                samples.append(time.perf_counter() - start)
+                gc.enable()
+    finally:
+        if enabled:
+            gc.enable()
+        else:
+            gc.disable()
+    peaks = []
+    for function in functions:
+        tracemalloc.start()
+        try:
+            function()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return [(statistics.median(samples), peak) for samples, peak in zip(times, peaks)]
+
+
+def directed_cases(edges, n, storage, seed):
+    """
+    Returns a list of (method name, function) pairs that exercise the public methods of
+    DirectedGraph and of the indexes it builds on the given edges, and the files the cases
+    write. On/off switches and accessors that only report on the graph (enable_*, disable_*,
+    *_info, stats, memory_bytes) are not timed on their own. Queries run on a graph that is
+    created once, so only the method itself is timed; methods that change the graph work on
+    a fresh copy, and the copy is timed with them
+    """
+    rnd = random.Random(seed)
+    graph = DirectedGraph(edges, storage=storage)
+    #grid() rounds n down to a square, so draw the queries from the vertices it made
+    sources = [rnd.randrange(graph.v_count) for _ in range(QUERIES)]
+    pairs = [(rnd.randrange(graph.v_count), rnd.randrange(graph.v_count)) for _ in range(QUERIES)]
+    paths = [graph.dfs(src)[:10] for src in sources]
+    lines = [f'{u} {v} {w}' for u, v, w in edges]
+    path = os.path.join(tempfile.gettempdir(), f'benchmark-{os.getpid()}.graph')
+    graph.save(path)
+    landmarks = graph.build_landmark_index()
+    landmarks_path = path + '.landmarks'
+    landmarks.save(landmarks_path)
+    hierarchy = graph.build_contraction_hierarchy()
+    cached = DirectedGraph(edges, storage=storage)
+    cached.enable_dijkstra_cache()
+    instrumented = DirectedGraph(edges, storage=storage)
+    instrumented.enable_instrumentation()
+
+    def mutate():
+        copy = DirectedGraph(edges, storage=storage)
+        for u, v, _ in edges[::10]:
+            copy.remove_edge(u, v)
+        copy.add_vertex()
+
+    def add_vertex():
+        copy = DirectedGraph(storage=storage)
+        for _ in range(n):
+            copy.add_vertex()
+
+    def add_edges():
+        copy = DirectedGraph(storage=storage)
+        copy.add_vertices(n)
+        copy.add_edges(edges)
+
+    def remove_edges():
+        copy = DirectedGraph(edges, storage=storage)
+        copy.remove_edges((u, v) for u, v, _ in edges[::10])
+
+    def batch():
+        copy = DirectedGraph(edges, storage=storage)
+        with copy.batch() as changes:
+            for u, v, w in edges[::10]:
+                changes.remove_edge(u, v)
+                changes.add_edge(v, u, w)
+            changes.add_vertex()
+
+    def track_untrack():
+        for src in sources:
+            graph.untrack_shortest_paths(graph.track_shortest_paths(src))
+
+    def track():
+        #the tree is repaired on every change, so time the repairs along with the build
+        copy = DirectedGraph(edges, storage=storage)
+        copy.track_shortest_paths(sources[0])
+        for u, v, _ in edges[::10]:
+            copy.remove_edge(u, v)
+
+    def snapshot():
+        copy = DirectedGraph(edges, storage=storage)
+        copy.snapshot()
+        #the first change to each row after a snapshot copies that row
+        for u, v, w in edges[::10]:
+            copy.add_edge(u, v, w + 1)
+
+    return [
+        ('__init__', lambda: DirectedGraph(edges, storage=storage)),
+        ('from_edgelist', lambda: DirectedGraph.from_edgelist(lines, storage=storage)),
+        ('add_edge/remove_edge', mutate),
+        ('add_vertex', add_vertex),
+        ('add_vertices/add_edges', add_edges),
+        ('remove_edges', remove_edges),
+        ('batch', batch),
+        ('snapshot', snapshot),
+        ('reversed', graph.reversed),
+        ('get_vertices', graph.get_vertices),
+        ('get_edges', graph.get_edges),
+        ('is_valid_path', lambda: [graph.is_valid_path(p) for p in paths]),
+        ('are_valid_paths', lambda: graph.are_valid_paths(paths, weights=True)),
+        ('dfs', lambda: [graph.dfs(src) for src in sources]),
+        ('dfs[instrumented]', lambda: [instrumented.dfs(src) for src in sources]),
+        ('bfs', lambda: [graph.bfs(src) for src in sources]),
+        ('iter_dfs', lambda: [list(graph.iter_dfs(src, max_depth=3)) for src in sources]),
+        ('iter_bfs', lambda: [list(graph.iter_bfs(src, max_depth=3)) for src in sources]),
+        ('bfs_levels', lambda: [graph.bfs_levels(src) for src in sources]),
+        ('parallel_bfs_levels', lambda: [graph.parallel_bfs_levels(src, processes=2) for src in sources]),
+        ('has_cycle', graph.has_cycle),
+        ('topological_order', graph.topological_order),
+        ('dijkstra', lambda: [graph.dijkstra(src) for src in sources]),
+        ('dijkstra[heap]', lambda: [graph.dijkstra(src, engine='heap') for src in sources]),
+        ('dijkstra[instrumented]', lambda: [instrumented.dijkstra(src) for src in sources]),
+        #the first round fills the cache, so the median times cache hits
+        ('dijkstra[cached]', lambda: [cached.dijkstra(src) for src in sources]),
+        ('shortest_path', lambda: [graph.shortest_path(s, t) for s, t in pairs]),
+        ('shortest_path[bidirectional]', lambda: [graph.shortest_path(s, t, bidirectional=True) for s, t in pairs]),
+        ('dijkstra_many', lambda: graph.dijkstra_many(sources, processes=1)),
+        ('all_pairs_shortest_paths', lambda: graph.all_pairs_shortest_paths(processes=1)),
+        ('track_shortest_paths', track),
+        ('track/untrack_shortest_paths', track_untrack),
+        ('build_landmark_index', graph.build_landmark_index),
+        ('LandmarkIndex.query', lambda: [landmarks.query(s, t) for s, t in pairs]),
+        ('LandmarkIndex.lower_bound', lambda: [landmarks.lower_bound(s, t) for s, t in pairs]),
+        ('LandmarkIndex.save', lambda: landmarks.save(landmarks_path)),
+        ('LandmarkIndex.load', lambda: LandmarkIndex.load(landmarks_path, graph)),
+        ('build_contraction_hierarchy', graph.build_contraction_hierarchy),
+        ('ContractionHierarchy.query', lambda: [hierarchy.query(s, t) for s, t in pairs]),
+        ('save', lambda: graph.save(path)),
+        ('load', lambda: DirectedGraph.load(path).get_edges()),
+    ], [path, landmarks_path]
+
+
+def undirected_cases(edges, n, storage, seed):
+    """
+    Same as directed_cases() for UndirectedGraph. Vertex names are the vertex numbers as
+    strings and edge weights are dropped
+    """
+    rnd = random.Random(seed)
+    pairs = [(str(u), str(v)) for u, v, _ in edges]
+    graph = UndirectedGraph(pairs, storage=storage)
+    instrumented = UndirectedGraph(pairs, storage=storage)
+    instrumented.enable_instrumentation()
+    names = graph.get_vertices()
+    sources = [rnd.choice(names) for _ in range(QUERIES)] if len(names) != 0 else []
+    queries = [(rnd.choice(names), rnd.choice(names)) for _ in range(QUERIES)] if len(names) != 0 else []
+    paths = [graph.dfs(src)[:10] for src in sources]
+    lines = [f'{u} {v}' for u, v in pairs]
+    path = os.path.join(tempfile.gettempdir(), f'benchmark-{os.getpid()}.graph')
+    graph.save(path)
+
+    def mutate():
+        copy = UndirectedGraph(pairs, storage=storage)
+        for u, v in pairs[::10]:
+            copy.remove_edge(u, v)
+        for v in names[::20]:
+            copy.remove_vertex(v)
+
+    def add_vertex():
+        copy = UndirectedGraph(storage=storage)
+        for v in names:
+            copy.add_vertex(v)
+
+    def add_edges():
+        copy = UndirectedGraph(storage=storage)
+        copy.add_vertices(names)
+        copy.add_edges(pairs)
+
+    def remove_edges():
+        copy = UndirectedGraph(pairs, storage=storage)
+        copy.remove_edges(pairs[::10])
+
+    def batch():
+        copy = UndirectedGraph(pairs, storage=storage)
+        with copy.batch() as changes:
+            for u, v in pairs[::10]:
+                changes.remove_edge(u, v)
+            for v in names[::20]:
+                changes.remove_vertex(v)
+                changes.add_edge(v, names[0])
+
+    def snapshot():
+        copy = UndirectedGraph(pairs, storage=storage)
+        copy.snapshot()
+        #the first change to each vertex after a snapshot copies its neighbors
+        for u, v in pairs[::10]:
+            copy.remove_edge(u, v)
+
+    return [
+        ('__init__', lambda: UndirectedGraph(pairs, storage=storage)),
+        ('from_edgelist', lambda: UndirectedGraph.from_edgelist(lines, storage=storage)),
+        ('remove_edge/remove_vertex', mutate),
+        ('add_vertex', add_vertex),
+        ('add_vertices/add_edges', add_edges),
+        ('remove_edges', remove_edges),
+        ('batch', batch),
+        ('snapshot', snapshot),
+        ('get_vertices', graph.get_vertices),
+        ('get_edges', graph.get_edges),
+        ('iter_edges', lambda: list(graph.iter_edges())),
+        ('is_valid_path', lambda: [graph.is_valid_path(p) for p in paths]),
+        ('are_valid_paths', lambda: graph.are_valid_paths(paths)),
+        ('dfs', lambda: [graph.dfs(src) for src in sources]),
+        ('dfs[instrumented]', lambda: [instrumented.dfs(src) for src in sources]),
+        ('bfs', lambda: [graph.bfs(src) for src in sources]),
+        ('iter_dfs', lambda: [list(graph.iter_dfs(src, max_depth=3)) for src in sources]),
+        ('iter_bfs', lambda: [list(graph.iter_bfs(src, max_depth=3)) for src in sources]),
+        ('bfs_levels', lambda: [graph.bfs_levels(src) for src in sources]),
+        ('parallel_bfs_levels', lambda: [graph.parallel_bfs_levels(src, processes=2) for src in sources]),
+        ('count_connected_components', graph.count_connected_components),
+        ('connected', lambda: [graph.connected(u, v) for u, v in queries]),
+        ('has_cycle', graph.has_cycle),
+        ('save', lambda: graph.save(path)),
+        ('load', lambda: UndirectedGraph.load(path).get_edges()),
+    ], [path]
+
+
+def run(sizes=DEFAULT_SIZES, generators=None, seed=0, repeat=DEFAULT_REPEAT, directed_storage='matrix',
+        undirected_storage='list', log=None) -> dict:
+    """
+    Benchmarks both graph classes on every generator and size and returns the results as a
+    dictionary ready for json.dump(). results maps 'class/generator/size/method' to the
+    median time in seconds over repeat runs and the peak traced memory in bytes
+    """
+    results = dict()
+    calibration = []
+    for name in generators or GENERATORS:
+        for n in sizes:
+            edges = GENERATORS[name](n, seed=seed)
+            for kind, cases in (('DirectedGraph', directed_cases), ('UndirectedGraph', undirected_cases)):
+                storage = directed_storage if kind == 'DirectedGraph' else undirected_storage
+                methods, files = cases(edges, n, storage, seed)
+                try:
+                    measured = measure([function for _, function in methods] + [calibrate], repeat)
+                    calibration.append(measured.pop()[0])
+                    for (method, _), (seconds, peak) in zip(methods, measured):
+                        key = f'{kind}/{name}/{n}/{method}'
+                        results[key] = {'seconds': seconds, 'peak_bytes': peak}
+                        if log is not None:
+                            print(f'{key:60} {seconds * 1000:10.3f} ms {peak / 1024:10.1f} KiB', file=log)
+                finally:
+                    for path in files:
+                        os.remove(path)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'repeat': repeat,
+            'sizes': list(sizes),
+            'directed_storage': directed_storage,
+            'undirected_storage': undirected_storage,
+            'calibration_seconds': statistics.median(calibration) if calibration else 0,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold=DEFAULT_THRESHOLD, min_seconds=DEFAULT_MIN_SECONDS,
+            min_bytes=DEFAULT_MIN_BYTES) -> []:
+    """
+    Returns a list of (key, measure, baseline value, current value) for every result that is
+    more than threshold (a fraction) slower or larger in current than in baseline, and by
+    more than min_seconds or min_bytes. Baseline times are first scaled by how much slower
+    or faster the calibration workload ran in current, so a busier machine is not reported
+    as slower code. Results present in only one of the two, or zero in the baseline, are
+    ignored
+    """
+    scale = 1.0
+    before_calibration = baseline['meta'].get('calibration_seconds', 0)
+    after_calibration = current['meta'].get('calibration_seconds', 0)
+    if before_calibration > 0 and after_calibration > 0:
+        scale = after_calibration / before_calibration
+    floors = {'seconds': min_seconds, 'peak_bytes': min_bytes}
+    regressions = []
+    for key, before in baseline['results'].items():
+        after = current['results'].get(key)
+        if after is None:
+            continue
+        for field, floor in floors.items():
+            expected = before[field] * scale if field == 'seconds' else before[field]
+            if (expected > 0 and after[field] > expected * (1 + threshold)
+                    and after[field] - expected > floor):
+                regressions.append((key, field, before[field], after[field]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    """
+    Command line entry point. Writes results to --out and, with --baseline, lists results
+    that regressed and returns 1 if there are any
+    """
+    parser = argparse.ArgumentParser(description='Benchmark DirectedGraph and UndirectedGraph')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--generators', nargs='+', choices=sorted(GENERATORS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--directed-storage', default='matrix')
+    parser.add_argument('--undirected-storage', default='list')
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--min-seconds', type=float, default=DEFAULT_MIN_SECONDS,
+                        help='ignore timing changes smaller than this')
+    parser.add_argument('--min-bytes', type=int, default=DEFAULT_MIN_BYTES,
+                        help='ignore memory changes smaller than this')
+    args = parser.parse_args(argv)
+    current = run(args.sizes, args.generators, args.seed, args.repeat, args.directed_storage,
+                  args.undirected_storage, log=sys.stdout)
+    with open(args.out, 'w') as file:
+        json.dump(current, file, indent=2, sort_keys=True)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare(baseline, current, args.threshold, args.min_seconds, args.min_bytes)
+    for key, field, before, after in regressions:
+        print(f'REGRESSION {key} {field}: {before:.6g} -> {after:.6g} ({after / before - 1:+.0%})')
+    return 1 if len(regressions) != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
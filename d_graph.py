@@ -3,8 +3,105 @@
 # Assignment: Assignment 6
 # Description: Implementation of a directed graph and associated functions
 
+import bisect
 import heapq
-from collections import deque
+import json
+import os
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+
+from graph_io import iter_edge_chunks, read_graph, write_graph
+from graph_parallel import SharedArrays, parallel_bfs_levels, worker_arrays
+from graph_stats import CallStats, Instrumentation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#largest edge weight for which dijkstra(engine='auto') uses a bucket queue instead of a heap
+BUCKET_MAX_WEIGHT = 1000
+
+
+class DistanceCache:
+    """
+    Least-recently-used cache of dijkstra() results for one graph, bounded by the total
+    size of the cached distances. Each result is stored as an array('d') of distances and a
+    bytearray marking which of them were ints, so sys.getsizeof() counts every byte it
+    holds and a hit returns the same values and types as the engine did. The cache belongs
+    to one graph version at a time and is emptied when the version moves on, so a result
+    from before a change is never returned
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Store entries as an OrderedDict of src -> (distances, int flags), least recently used first
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.version = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, src: int, version: int):
+        """
+        Returns a new list of the cached distances from src at the given graph version, or None
+        """
+        if version != self.version:
+            self.clear()
+            self.version = version
+        entry = self.entries.get(src)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(src)
+        values, ints = entry
+        return [int(d) if is_int else d for d, is_int in zip(values.tolist(), ints)]
+
+    def put(self, src: int, version: int, distances: []) -> None:
+        """
+        Caches distances from src, evicting least recently used entries to stay within max_bytes
+        """
+        if version != self.version:
+            self.clear()
+            self.version = version
+        entry = (array('d', distances), bytearray(isinstance(d, int) for d in distances))
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+        while self.size + size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self._size(evicted)
+            self.evictions += 1
+        self.entries[src] = entry
+        self.size += size
+
+    @staticmethod
+    def _size(entry) -> int:
+        """
+        Returns the bytes held by one entry
+        """
+        return sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+
+    def clear(self) -> None:
+        """
+        Drops every entry (statistics are kept)
+        """
+        self.entries.clear()
+        self.size = 0
+
+    def info(self) -> dict:
+        """
+        Returns hit/miss/eviction counts and current and maximum size
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes}
+
 
 class DirectedGraph:
     """
@@ -15,16 +112,56 @@ class DirectedGraph:
     - vertex names are integers
     """
 
-    def __init__(self, start_edges=None):
+    def __init__(self, start_edges=None, storage='matrix'):
         """
-        Store graph info as adjacency matrix
+        Store graph info as adjacency matrix. With storage='sparse' the graph is instead
+        stored as a list of per-vertex dictionaries mapping destination index to edge weight,
+        so memory is proportional to the number of edges. With storage='numpy' the matrix is
+        a NumPy 2-D array whose capacity doubles as vertices are added; it holds int64 weights
+        until the first non-integer weight arrives, then float64. Graphs returned by
+        load() use read-only compressed-row storage ('csr') until they are first changed
         """
+        if storage not in ('matrix', 'sparse', 'numpy'):
+            raise ValueError(f"unknown storage '{storage}', expected 'matrix', 'sparse' or 'numpy'")
+        if storage == 'numpy' and np is None:
+            raise ImportError("storage='numpy' requires NumPy to be installed")
+        self.storage = storage
         self.v_count = 0
-        self.adj_matrix = []
+        self.adj_matrix = None
+        self.adj_list = None
+        #(offsets, targets, weights) arrays for storage loaded from a file, see load()
+        self.csr = None
+        #reverse neighbor dictionaries for sparse storage, built on first use by _in_edges()
+        self._reverse = None
+        #upper bound on edge weights (never lowered by remove_edge) and whether all weights
+        #seen so far are integers, used to choose the dijkstra engine
+        self._max_weight = 0
+        self._integer_weights = True
+        #bumped by every add_vertex(), add_edge() and remove_edge() so cached results can be checked
+        self.version = 0
+        self._dijkstra_cache = None
+        #shortest path trees registered with track_shortest_paths(), repaired on every change
+        self._trees = []
+        #collector set by enable_instrumentation(); None keeps instrumented methods on their plain path
+        self._instrumentation = None
+        #(version, out-neighbor bitsets, in-neighbor bitsets) built by bfs_levels()
+        self._bitsets = None
+        #(version, offsets, targets, weights) built by _csr()
+        self._csr_arrays = None
+        #one flag per row still shared with a snapshot, or None if no snapshot shares any
+        self._shared = None
+        if storage == 'matrix':
+            self.adj_matrix = []
+        elif storage == 'sparse':
+            self.adj_list = []
+        else:
+            self.adj_matrix = np.zeros((0, 0), dtype=np.int64)
 
         # populate graph with initial vertices and edges (if provided)
         # before using, implement add_vertex() and add_edge() methods
-        if start_edges is not None:
+        if start_edges is not None and storage == 'numpy':
+            self._scatter_edges(start_edges)
+        elif start_edges is not None:
             v_count = 0
             for u, v, _ in start_edges:
                 v_count = max(v_count, u, v)
@@ -43,7 +180,7 @@ class DirectedGraph:
         out += ' '.join(['{:2}'.format(i) for i in range(self.v_count)]) + '\n'
         out += '-' * (self.v_count * 3 + 3) + '\n'
         for i in range(self.v_count):
-            row = self.adj_matrix[i]
+            row = self._row(i)
             out += '{:2} |'.format(i)
             out += ' '.join(['{:2}'.format(w) for w in row]) + '\n'
         out = f"GRAPH ({self.v_count} vertices):\n{out}"
@@ -51,10 +188,175 @@ class DirectedGraph:
 
     # ------------------------------------------------------------------ #
 
+    def _scatter_edges(self, start_edges) -> None:
+        """
+        Builds the NumPy matrix from a sequence of (src, dst, weight) tuples in one
+        vectorized assignment, applying the same rules as add_edge()
+        """
+        edges = list(start_edges)
+        src = np.fromiter((u for u, _, _ in edges), dtype=np.int64, count=len(edges))
+        dst = np.fromiter((v for _, v, _ in edges), dtype=np.int64, count=len(edges))
+        #int64 when every weight is a Python int, float64 as soon as one is a float
+        weight = np.asarray([w for _, _, w in edges])
+        #as in the constructor, the graph gets max(0, largest index) + 1 vertices
+        v_count = max(0, int(max(src.max(), dst.max()))) + 1 if len(edges) else 1
+        self.v_count = v_count
+        keep = (src >= 0) & (dst >= 0) & (src != dst) & (weight >= 1)
+        src, dst, weight = src[keep], dst[keep], weight[keep]
+        #a repeated edge keeps its last weight, as it would with repeated add_edge() calls
+        _, last = np.unique((src * v_count + dst)[::-1], return_index=True)
+        last = len(src) - 1 - last
+        weight = weight[last]
+        if weight.dtype == np.float64 and np.all(np.isfinite(weight) & (weight == np.floor(weight))):
+            weight = weight.astype(np.int64)
+        self.adj_matrix = np.zeros((v_count, v_count), dtype=np.int64)
+        if weight.dtype == np.float64:
+            self._float_weights()
+        self.adj_matrix[src[last], dst[last]] = weight
+        if len(last) != 0:
+            self._max_weight = weight.max().item()
+
+    def _float_weights(self) -> None:
+        """
+        Records that the graph has a non-integer weight. NumPy storage switches its matrix
+        to float64 first, so the weight about to be written is not truncated
+        """
+        self._integer_weights = False
+        if self.storage == 'numpy' and self.adj_matrix.dtype != np.float64:
+            #astype() copies, so no row is shared with a snapshot any more
+            self.adj_matrix = self.adj_matrix.astype(np.float64)
+            self._shared = None
+
+    def _row(self, v: int) -> []:
+        """
+        Returns the full row of edge weights for vertex v (0 where there is no edge)
+        """
+        if self.storage == 'sparse':
+            neighbors = self.adj_list[v]
+            return [neighbors.get(i, 0) for i in range(self.v_count)]
+        if self.storage == 'numpy':
+            return self.adj_matrix[v, :self.v_count].tolist()
+        if self.storage == 'csr':
+            row = [0] * self.v_count
+            for dst, weight in self._out_edges(v):
+                row[dst] = weight
+            return row
+        return self.adj_matrix[v]
+
+    def _weight(self, src: int, dst: int) -> int:
+        """
+        Returns the weight of edge src -> dst, or 0 if there is no such edge
+        """
+        if self.storage == 'sparse':
+            return self.adj_list[src].get(dst, 0)
+        if self.storage == 'numpy':
+            return self.adj_matrix[src, dst].item()
+        if self.storage == 'csr':
+            offsets, targets, weights = self.csr
+            i = bisect.bisect_left(targets, dst, offsets[src], offsets[src + 1])
+            return weights[i] if i < offsets[src + 1] and targets[i] == dst else 0
+        return self.adj_matrix[src][dst]
+
+    def _out_edges(self, v: int, ordered=True) -> []:
+        """
+        Returns a list of (dst, weight) tuples for the edges leaving vertex v. When ordered
+        is True the tuples are sorted by destination index so traversals visit vertices in
+        ascending order regardless of storage
+        """
+        if self.storage == 'sparse':
+            if ordered:
+                return sorted(self.adj_list[v].items())
+            return list(self.adj_list[v].items())
+        if self.storage == 'numpy':
+            #nonzero entries of the row slice are already in ascending order
+            row = self.adj_matrix[v, :self.v_count]
+            indices = np.flatnonzero(row)
+            return list(zip(indices.tolist(), row[indices].tolist()))
+        if self.storage == 'csr':
+            #targets are stored in ascending order within each vertex
+            offsets, targets, weights = self.csr
+            start, end = offsets[v], offsets[v + 1]
+            return list(zip(targets[start:end], weights[start:end]))
+        return [(i, weight) for i, weight in enumerate(self.adj_matrix[v]) if weight != 0]
+
+    def _in_edges(self, v: int) -> []:
+        """
+        Returns a list of (src, weight) tuples for the edges entering vertex v. Matrix storage
+        reads column v; sparse storage builds reverse neighbor dictionaries on first use and
+        keeps them up to date from then on
+        """
+        if self.storage in ('sparse', 'csr'):
+            if self._reverse is None:
+                #built in full before it is stored, so other threads reading a snapshot never
+                #see it half filled
+                reverse = [dict() for _ in range(self.v_count)]
+                for src in range(self.v_count):
+                    for dst, weight in self._out_edges(src, ordered=False):
+                        reverse[dst][src] = weight
+                self._reverse = reverse
+            return list(self._reverse[v].items())
+        if self.storage == 'numpy':
+            column = self.adj_matrix[:self.v_count, v]
+            indices = np.flatnonzero(column)
+            return list(zip(indices.tolist(), column[indices].tolist()))
+        return [(i, row[v]) for i, row in enumerate(self.adj_matrix) if row[v] != 0]
+
+    def _materialize(self) -> None:
+        """
+        Copies a graph loaded from a file into sparse storage so it can be changed
+        """
+        self.adj_list = [dict(self._out_edges(v)) for v in range(self.v_count)]
+        self.storage = 'sparse'
+        self.csr = None
+        self._shared = None
+
+    def _unshare(self, v=None) -> None:
+        """
+        Gives the graph its own copy of row v (of every row if v is None) before the row is
+        changed, if a snapshot still shares it. NumPy storage is copied as a whole
+        """
+        shared = self._shared
+        if shared is None:
+            return
+        if self.storage == 'numpy':
+            self.adj_matrix = self.adj_matrix.copy()
+            self._shared = None
+            return
+        rows = self.adj_list if self.storage == 'sparse' else self.adj_matrix
+        if v is None:
+            for i in range(len(shared)):
+                if shared[i]:
+                    rows[i] = rows[i].copy()
+            self._shared = None
+        elif v < len(shared) and shared[v]:
+            rows[v] = rows[v].copy()
+            shared[v] = 0
+
     def add_vertex(self) -> int:
         """
         Method adds a new vertex to the graph and returns the number of vertices in the graph
         """
+        if self.storage == 'csr':
+            self._materialize()
+        self.version += 1
+        for tree in self._trees:
+            tree._vertex_added()
+        #sparse storage only needs an empty neighbor dictionary for the new vertex
+        if self.storage == 'sparse':
+            self.adj_list.append(dict())
+            if self._reverse is not None:
+                self._reverse.append(dict())
+            self.v_count += 1
+            return self.v_count
+        #numpy storage doubles its capacity when full, so new rows and columns are already zero
+        if self.storage == 'numpy':
+            capacity = len(self.adj_matrix)
+            if self.v_count == capacity:
+                grown = np.zeros((max(1, 2 * capacity),) * 2, dtype=self.adj_matrix.dtype)
+                grown[:capacity, :capacity] = self.adj_matrix
+                self.adj_matrix = grown
+            self.v_count += 1
+            return self.v_count
         #if there are currently no vertices, add an empty list
         current_vertices = len(self.adj_matrix)
         if current_vertices == 0:
@@ -66,6 +368,8 @@ class DirectedGraph:
             self.adj_matrix.append([0] * current_vertices)
             self.v_count += 1
         #add one 0 to each vertices to account for new vertice
+        if self._shared is not None:
+            self._unshare()
         for item in self.adj_matrix:
             item.append(0)
         return len(self.adj_matrix)
@@ -79,14 +383,31 @@ class DirectedGraph:
         edge already exists in the graph, the method will update its weight.
         """
         #check whether src, dst, and weight meet requirements
-        current_length = len(self.adj_matrix)
+        current_length = self.v_count
         if src > current_length-1 or src < 0 or dst > current_length-1 or dst < 0 or src == dst:
             return
         if weight < 1:
             return
+        if self.storage == 'csr':
+            self._materialize()
+        self.version += 1
+        self._max_weight = max(self._max_weight, weight)
+        if not _is_integer(weight):
+            self._float_weights()
+        old_weight = self._weight(src, dst) if self._trees else 0
+        if self._shared is not None:
+            self._unshare(src)
         #set edge
+        if self.storage == 'sparse':
+            self.adj_list[src][dst] = weight
+            if self._reverse is not None:
+                self._reverse[dst][src] = weight
+        elif self.storage == 'numpy':
+            self.adj_matrix[src, dst] = weight
         else:
             self.adj_matrix[src][dst] = weight
+        for tree in self._trees:
+            tree._edge_changed(src, dst, old_weight, weight)
 
 
     def remove_edge(self, src: int, dst: int) -> None:
@@ -98,9 +419,137 @@ class DirectedGraph:
         current_vertices = self.v_count
         if src < 0 or src > current_vertices -1 or dst < 0 or dst > current_vertices -1:
             return
-        #if requirements met, set edge to 0
+        if self.storage == 'csr':
+            self._materialize()
+        self.version += 1
+        old_weight = self._weight(src, dst) if self._trees else 0
+        if self._shared is not None:
+            self._unshare(src)
+        #if requirements met, set edge to 0 (or drop it from the neighbor dictionary)
+        if self.storage == 'sparse':
+            self.adj_list[src].pop(dst, None)
+            if self._reverse is not None:
+                self._reverse[dst].pop(src, None)
+        elif self.storage == 'numpy':
+            self.adj_matrix[src, dst] = 0
         else:
             self.adj_matrix[src][dst] = 0
+        if old_weight != 0:
+            for tree in self._trees:
+                tree._edge_changed(src, dst, old_weight, 0)
+
+
+    def add_vertices(self, n: int) -> int:
+        """
+        Adds n vertices at once and returns the number of vertices in the graph. Storage is
+        grown a single time: each matrix row is extended by n columns in one step instead of
+        one column per vertex
+        """
+        if n <= 0:
+            return self.v_count
+        if self.storage == 'csr':
+            self._materialize()
+        self.version += 1
+        for tree in self._trees:
+            for _ in range(n):
+                tree._vertex_added()
+        v_count = self.v_count + n
+        if self.storage == 'sparse':
+            self.adj_list.extend(dict() for _ in range(n))
+            if self._reverse is not None:
+                self._reverse.extend(dict() for _ in range(n))
+        elif self.storage == 'numpy':
+            capacity = len(self.adj_matrix)
+            if v_count > capacity:
+                grown = np.zeros((max(v_count, 2 * capacity),) * 2, dtype=self.adj_matrix.dtype)
+                grown[:capacity, :capacity] = self.adj_matrix
+                self.adj_matrix = grown
+        else:
+            if self._shared is not None:
+                self._unshare()
+            for row in self.adj_matrix:
+                row.extend([0] * n)
+            self.adj_matrix.extend([0] * v_count for _ in range(n))
+        self.v_count = v_count
+        return self.v_count
+
+
+    def add_edges(self, edges) -> None:
+        """
+        Adds every (src, dst, weight) edge in EDGES with the same result as calling add_edge()
+        for each in turn. The whole batch is checked first, each edge is written once, and the
+        version and tracked shortest path trees are updated once at the end
+        """
+        self._apply_edges(edges)
+
+
+    def remove_edges(self, edges) -> None:
+        """
+        Removes every (src, dst) edge in EDGES with the same result as calling remove_edge()
+        for each in turn, updating the version and tracked shortest path trees once at the end
+        """
+        self._apply_edges((src, dst, None) for src, dst in edges)
+
+
+    def batch(self):
+        """
+        Returns a DirectedGraphBatch for use in a with block. Vertex and edge changes made
+        through it are collected and applied together when the block ends
+        """
+        return DirectedGraphBatch(self)
+
+
+    def _apply_edges(self, changes, repair=True) -> None:
+        """
+        Applies a sequence of (src, dst, weight) edge changes, where weight None removes the
+        edge, with the same result as calling add_edge() or remove_edge() for each in turn.
+        Changes those methods would ignore are dropped and only the last change to each edge
+        is written. With repair=False tracked shortest path trees are left for the caller
+        to rebuild
+        """
+        v_count = self.v_count
+        final = dict()
+        for src, dst, weight in changes:
+            if 0 <= src < v_count and 0 <= dst < v_count:
+                if weight is None:
+                    final[(src, dst)] = None
+                elif src != dst and weight >= 1:
+                    final[(src, dst)] = weight
+        if len(final) == 0:
+            return
+        if self.storage == 'csr':
+            self._materialize()
+        self.version += 1
+        added = [weight for weight in final.values() if weight is not None]
+        if len(added) != 0:
+            self._max_weight = max(self._max_weight, max(added))
+            if not all(_is_integer(weight) for weight in added):
+                self._float_weights()
+        if self._shared is not None:
+            for src, _ in final:
+                self._unshare(src)
+        if self.storage == 'sparse':
+            reverse = self._reverse
+            for (src, dst), weight in final.items():
+                if weight is None:
+                    self.adj_list[src].pop(dst, None)
+                    if reverse is not None:
+                        reverse[dst].pop(src, None)
+                else:
+                    self.adj_list[src][dst] = weight
+                    if reverse is not None:
+                        reverse[dst][src] = weight
+        elif self.storage == 'numpy':
+            #keys are unique, so one vectorized assignment writes every edge
+            src = np.fromiter((src for src, _ in final), dtype=np.int64, count=len(final))
+            dst = np.fromiter((dst for _, dst in final), dtype=np.int64, count=len(final))
+            self.adj_matrix[src, dst] = [0 if weight is None else weight for weight in final.values()]
+        else:
+            for (src, dst), weight in final.items():
+                self.adj_matrix[src][dst] = 0 if weight is None else weight
+        if repair:
+            for tree in self._trees:
+                tree._rebuild()
 
 
     def get_vertices(self) -> []:
@@ -120,12 +569,15 @@ class DirectedGraph:
         The second element in the tuple refers to the destination vertex. The third element in the
         tuple is the weight of the edge.
         """
+        if self.storage == 'numpy':
+            matrix = self.adj_matrix[:self.v_count, :self.v_count]
+            src, dst = matrix.nonzero()
+            return list(zip(src.tolist(), dst.tolist(), matrix[src, dst].tolist()))
         edge_list = []
-        #iterate through adj_matrix and each vertex in adj_matrix to find edges (values > 0)
+        #iterate through each vertex to find its edges (values > 0)
         for i in range(self.v_count):
-            for j in range(len(self.adj_matrix[i])):
-                if self.adj_matrix[i][j] != 0:
-                    edge_list.append((i, j, self.adj_matrix[i][j]))
+            for j, weight in self._out_edges(i):
+                edge_list.append((i, j, weight))
         return edge_list
 
 
@@ -140,59 +592,254 @@ class DirectedGraph:
         for i in range(len(path)-1):
             path_location = path[i]
             next_location = path[i+1]
-            if self.adj_matrix[path_location][next_location] == 0:
+            if self._weight(path_location, next_location) == 0:
                 return False
         return True
 
 
+    def are_valid_paths(self, paths, offsets=None, weights=False):
+        """
+        Checks a batch of paths and returns a list holding is_valid_path()'s answer for each,
+        except that a step to or from a vertex outside the graph counts as a missing edge.
+        PATHS is a list of vertex lists or, when OFFSETS is given, one flat sequence in which
+        path i is paths[offsets[i]:offsets[i + 1]]. With weights=True returns a tuple
+        (valid, totals), where totals holds the total weight of each valid path and inf for
+        each invalid one. NumPy storage looks up every consecutive pair of the batch in one
+        vectorized index into the matrix; other storages look the pairs up one at a time.
+        """
+        if self.storage == 'numpy':
+            if offsets is None:
+                paths = list(paths)
+                offsets = [0]
+                for path in paths:
+                    offsets.append(offsets[-1] + len(path))
+                paths = [v for path in paths for v in path]
+            valid, totals = self._check_paths_numpy(paths, offsets)
+        else:
+            if offsets is not None:
+                #plain Python ints are much faster to index with than NumPy scalars
+                flat = paths.tolist() if hasattr(paths, 'tolist') else paths
+                offsets = offsets.tolist() if hasattr(offsets, 'tolist') else offsets
+                paths = (flat[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1))
+            #read rows directly instead of calling _weight() once per step
+            rows = self.adj_list if self.storage == 'sparse' else self.adj_matrix
+            sparse = self.storage == 'sparse'
+            v_count = self.v_count
+            valid, totals = [], []
+            for path in paths:
+                total = 0
+                for src, dst in zip(path, path[1:]):
+                    weight = 0
+                    if 0 <= src < v_count and 0 <= dst < v_count:
+                        if sparse:
+                            weight = rows[src].get(dst, 0)
+                        elif rows is not None:
+                            weight = rows[src][dst]
+                        else:
+                            weight = self._weight(src, dst)
+                    if weight == 0:
+                        total = float('inf')
+                        break
+                    total += weight
+                valid.append(total != float('inf'))
+                totals.append(total)
+        if weights:
+            return valid, totals
+        return valid
+
+
+    def _check_paths_numpy(self, flat, offsets):
+        """
+        are_valid_paths() for NumPy storage. Returns (valid, totals) as lists
+        """
+        flat = np.asarray(flat, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        starts, ends = offsets[:-1], offsets[1:]
+        #position k holds the step from flat[k] to flat[k + 1]; steps that cross from one path
+        #into the next are not part of any path
+        src, dst = flat[:-1], flat[1:]
+        step_weights = np.zeros(len(src), dtype=self.adj_matrix.dtype)
+        inside = (src >= 0) & (src < self.v_count) & (dst >= 0) & (dst < self.v_count)
+        step_weights[inside] = self.adj_matrix[src[inside], dst[inside]]
+        missing = np.concatenate(([0], np.cumsum(step_weights == 0)))
+        summed = np.concatenate(([0], np.cumsum(step_weights)))
+        #path i owns steps starts[i] to ends[i] - 2, so prefix sums give its counts directly;
+        #an empty path at the very end has no steps and is clipped onto the last prefix sum
+        starts = np.minimum(starts, len(missing) - 1)
+        last = np.minimum(np.maximum(ends - 1, starts), len(missing) - 1)
+        valid = (missing[last] - missing[starts]) == 0
+        totals = np.where(valid, summed[last] - summed[starts], np.inf)
+        if self.adj_matrix.dtype == np.float64:
+            return valid.tolist(), totals.tolist()
+        return valid.tolist(), [int(total) if ok else total for ok, total in zip(valid.tolist(), totals.tolist())]
+
+
     def dfs(self, v_start, v_end=None) -> []:
         """
         Method performs a depth-first search (DFS) in the graph and returns a list of vertices
         visited during the search, in the order they were visited.
         """
+        if self._instrumentation is not None:
+            return self._traced_traversal('dfs', self.iter_dfs, v_start, v_end)
+        return list(self.iter_dfs(v_start, v_end))
+
+
+    def bfs(self, v_start, v_end=None) -> []:
+        """
+        Method works the same as DFS above, except it implements a breadth-first search.
+        """
+        if self._instrumentation is not None:
+            return self._traced_traversal('bfs', self.iter_bfs, v_start, v_end)
+        return list(self.iter_bfs(v_start, v_end))
+
+
+    def _traced_traversal(self, method: str, traversal, v_start, v_end) -> []:
+        """
+        Runs dfs() or bfs() and records its counters with the instrumentation
+        """
+        start = time.perf_counter()
+        visited = list(traversal(v_start, v_end))
+        stats = CallStats(method, time.perf_counter() - start)
+        stats.vertices = len(visited)
+        #every visited vertex has its edges scanned, except v_end where the search stops
+        expanded = visited[:-1] if len(visited) != 0 and visited[-1] == v_end else visited
+        stats.edges = sum(len(self._out_edges(v, ordered=False)) for v in expanded)
+        self._instrumentation.record(stats)
+        return visited
+
+
+    def iter_dfs(self, v_start, v_end=None, max_depth=None):
+        """
+        Generator version of dfs() that yields vertices as they are visited, so callers can
+        stop early. If max_depth is given, vertices more than max_depth edges from v_start
+        along the search tree are not explored.
+        """
         #initial condition
         if v_start < 0 or v_start > self.v_count -1:
-            return []
-        visited_vertices = []
+            return
+        #visited vertices are tracked in a bitmap indexed by vertex, giving O(1) checks
+        visited = bytearray(self.v_count)
         stack = []
-        stack.append(v_start)
-        # while stack length is not empty, pop a vertex, added to vertices visited (if not already visited)
+        stack.append((v_start, 0))
+        # while stack length is not empty, pop a vertex, yield it (if not already visited)
         # if vertex equals end point, stop there
         while len(stack) != 0:
-            vertex = stack.pop()
-            if vertex not in visited_vertices:
-                visited_vertices.append(vertex)
+            vertex, depth = stack.pop()
+            if not visited[vertex]:
+                visited[vertex] = 1
+                yield vertex
                 if vertex == v_end:
-                    break
+                    return
+                if max_depth is not None and depth >= max_depth:
+                    continue
                 #iterate through edges starting with highest index so that vertices are picked
                 #from the stack in ascending order:
-                for i in range(self.v_count-1, -1, -1):
-                    if self.adj_matrix[vertex][i] != 0:
-                        stack.append(i)
-        return visited_vertices
+                for i, _ in reversed(self._out_edges(vertex)):
+                    if not visited[i]:
+                        stack.append((i, depth + 1))
 
 
-    def bfs(self, v_start, v_end=None) -> []:
+    def iter_bfs(self, v_start, v_end=None, max_depth=None):
         """
-        Method works the same as DFS above, except it implements a breadth-first search.
+        Generator version of bfs() that yields vertices as they are visited, so callers can
+        stop early. If max_depth is given, vertices more than max_depth edges from v_start
+        are not explored.
         """
         queue = deque([])
         if v_start < 0 or v_start > self.v_count -1:
-            return []
-        vertices_visited = []
-        queue.appendleft(v_start)
+            return
+        #vertices are marked when queued; since the queue is first in first out this visits
+        #them in the same order as marking them when popped, without duplicate queue entries
+        visited = bytearray(self.v_count)
+        visited[v_start] = 1
+        queue.appendleft((v_start, 0))
         while len(queue) != 0:
             #pop from the right of the queue
-            vertex = queue.pop()
-            if vertex not in vertices_visited:
-                vertices_visited.append(vertex)
-                if vertex == v_end:
-                    break
-                for i in range(self.v_count):
-                #for i in range(self.v_count - 1, -1, -1):
-                    if self.adj_matrix[vertex][i] != 0:
-                        queue.appendleft(i)
-        return vertices_visited
+            vertex, depth = queue.pop()
+            yield vertex
+            if vertex == v_end:
+                return
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for i, _ in self._out_edges(vertex):
+                if not visited[i]:
+                    visited[i] = 1
+                    queue.appendleft((i, depth + 1))
+
+
+    def bfs_levels(self, v_start: int) -> []:
+        """
+        Returns the number of edges on a shortest (fewest hops) path from v_start to each
+        vertex, or inf where a vertex is not reachable. Frontier and visited vertices are kept
+        as bitsets (Python ints) and each level is expanded whichever way touches fewer
+        vertices: top-down ORs together the out-neighbor bitsets of the frontier, bottom-up
+        tests each unvisited vertex's in-neighbor bitset against the frontier. The bitsets take
+        about V * V / 4 bytes and are kept until the graph next changes.
+        """
+        levels = [float('inf')] * self.v_count
+        if v_start < 0 or v_start > self.v_count - 1:
+            return levels
+        out_bits, in_bits = self._bit_rows()
+        everything = (1 << self.v_count) - 1
+        frontier = visited = 1 << v_start
+        levels[v_start] = 0
+        level = 0
+        while frontier != 0:
+            level += 1
+            unvisited = everything & ~visited
+            if frontier.bit_count() > unvisited.bit_count():
+                reached = [v for v in _bit_indices(unvisited) if in_bits[v] & frontier]
+                frontier = _bits_from_indices(reached, self.v_count)
+            else:
+                next_frontier = 0
+                for v in _bit_indices(frontier):
+                    next_frontier |= out_bits[v]
+                frontier = next_frontier & unvisited
+                reached = _bit_indices(frontier)
+            for v in reached:
+                levels[v] = level
+            visited |= frontier
+        return levels
+
+
+    def parallel_bfs_levels(self, v_start: int, processes=None) -> []:
+        """
+        Returns the same hop counts as bfs_levels(), computed one level at a time with each
+        large frontier split across a pool of PROCESSES worker processes (default: one per
+        CPU) that share the graph in compressed-row form (see graph_parallel). The
+        compressed rows are built once per graph version and reused by later calls
+        """
+        offsets, targets, _ = self._csr()
+        levels = parallel_bfs_levels(offsets, targets, v_start, processes)
+        return [level if level != -1 else float('inf') for level in levels]
+
+
+    def _bit_rows(self):
+        """
+        Returns lists of out-neighbor and in-neighbor bitsets, one Python int per vertex with
+        bit i set for an edge to (or from) vertex i, rebuilt only after the graph changes
+        """
+        if self._bitsets is not None and self._bitsets[0] == self.version:
+            return self._bitsets[1], self._bitsets[2]
+        v_count = self.v_count
+        if self.storage == 'numpy':
+            nonzero = self.adj_matrix[:v_count, :v_count] != 0
+            out_bits = [int.from_bytes(row.tobytes(), 'little')
+                        for row in np.packbits(nonzero, axis=1, bitorder='little')]
+            in_bits = [int.from_bytes(row.tobytes(), 'little')
+                       for row in np.packbits(nonzero.T, axis=1, bitorder='little')]
+        else:
+            #packs one row at a time from neighbor lists, so only the finished ints stay alive
+            in_rows = [[] for _ in range(v_count)]
+            out_bits = []
+            for u in range(v_count):
+                targets = [v for v, _ in self._out_edges(u, ordered=False)]
+                for v in targets:
+                    in_rows[v].append(u)
+                out_bits.append(_bits_from_indices(targets, v_count))
+            in_bits = [_bits_from_indices(row, v_count) for row in in_rows]
+        self._bitsets = (self.version, out_bits, in_bits)
+        return out_bits, in_bits
 
 
     def has_cycle(self):
@@ -200,33 +847,125 @@ class DirectedGraph:
         Returns True if there is at least one cycle in the graph. If the graph is acyclic,
         the method returns False.
         """
-        #iterate through each vertice in adj_matrix and create two empty sets to keep track of position,
-        #as well as an empty stack. Use bfs logic to append and pop from the stack
-        for v in range(self.v_count):
-            discovered = set()
-            finished = set()
-            start = v
-            stack = []
-            stack.append(v)
-            while len(stack) != 0:
-                vertex = stack.pop()
-                if vertex in finished and vertex == start:
-                    return True
-                if vertex not in discovered:
-                    discovered.add(vertex)
-                    for i in range(self.v_count):
-                        if self.adj_matrix[vertex][i] != 0:
-                            stack.append(i)
-                #once vertex has been checked it is moved to finished set
-                finished.add(vertex)
-        return False
+        if self._instrumentation is None:
+            return self.topological_order()[1] is not None
+        start = time.perf_counter()
+        finished, path, last = self._topological_search()
+        stats = CallStats('has_cycle', time.perf_counter() - start)
+        stats.vertices = len(finished) + (len(path) if path is not None else 0)
+        stats.edges = sum(len(self._out_edges(v, ordered=False)) for v in finished)
+        if path is not None:
+            #vertices still on the path scanned their sorted edges up to the one leading to
+            #the next vertex on it, and the last one up to the edge that closed the cycle
+            for vertex, next_vertex in zip(path, path[1:] + [last]):
+                stats.edges += bisect.bisect_left(self._out_edges(vertex), (next_vertex,)) + 1
+        self._instrumentation.record(stats)
+        return path is not None
+
+
+    def topological_order(self):
+        """
+        Returns a tuple (order, cycle) computed in a single O(V + E) pass. If the graph is
+        acyclic, order lists every vertex so that each edge goes from an earlier vertex to a
+        later one, and cycle is None. Otherwise order is None and cycle is a list of vertices
+        along one cycle, starting and ending at the same vertex.
+        """
+        finished, path, last = self._topological_search()
+        if path is not None:
+            return None, path[path.index(last):] + [last]
+        #reverse finishing order is a topological order
+        finished.reverse()
+        return finished, None
+
+
+    def _topological_search(self):
+        """
+        The search behind topological_order(). Returns (finished, None, None) with the vertices
+        in finishing order if the graph is acyclic. Otherwise it stops at the first edge that
+        closes a cycle and returns (finished, path, last), where path is the current search
+        path and last the vertex on it that the edge leads back to
+        """
+        #iterative three-color dfs: 0 = not yet discovered, 1 = on the current path, 2 = finished.
+        #reaching a vertex that is still on the path means the path from it back to here is a cycle
+        color = bytearray(self.v_count)
+        finished = []
+        for start in range(self.v_count):
+            if color[start] != 0:
+                continue
+            color[start] = 1
+            path = [start]
+            edges = [iter(self._out_edges(start))]
+            while len(path) != 0:
+                for i, _ in edges[-1]:
+                    if color[i] == 0:
+                        color[i] = 1
+                        path.append(i)
+                        edges.append(iter(self._out_edges(i)))
+                        break
+                    if color[i] == 1:
+                        return finished, path, i
+                else:
+                    #all edges of the vertex on top of the path are explored, so it is finished
+                    vertex = path.pop()
+                    edges.pop()
+                    color[vertex] = 2
+                    finished.append(vertex)
+        return finished, None, None
 
 
-    def dijkstra(self, src: int) -> []:
+    def dijkstra(self, src: int, engine='auto') -> []:
         """
         Implements the Dijkstra algorithm to compute the length of the shortest path
         from a given vertex to all other vertices in the graph and returns a list with one value per
         vertex. If a certain vertex is not reachable from SRC, the returned value is infinity (inf).
+        engine='heap' uses a binary heap and engine='bucket' a bucket queue (Dial's algorithm),
+        which needs integer weights. engine='auto' picks the bucket queue when all weights are
+        integers no larger than BUCKET_MAX_WEIGHT. If enable_dijkstra_cache() has been called,
+        repeat queries on an unchanged graph are answered from the cache.
+        """
+        if engine not in ('auto', 'heap', 'bucket'):
+            raise ValueError(f"unknown engine '{engine}', expected 'auto', 'heap' or 'bucket'")
+        if engine == 'bucket' and not self._integer_weights:
+            raise ValueError("engine='bucket' requires integer edge weights")
+        instrumentation = self._instrumentation
+        stats = None
+        if instrumentation is not None:
+            stats = CallStats('dijkstra')
+            start = time.perf_counter()
+        cache = self._dijkstra_cache
+        if cache is not None:
+            distances = cache.get(src, self.version)
+            if distances is not None:
+                if stats is not None:
+                    stats.seconds = time.perf_counter() - start
+                    instrumentation.record(stats)
+                return distances
+        buckets = engine == 'bucket' or (engine == 'auto' and self._integer_weights
+                                         and self._max_weight <= BUCKET_MAX_WEIGHT)
+        if buckets:
+            distances = self._dijkstra_buckets(src, stats)
+        else:
+            distances = self._dijkstra_heap(src)
+        if stats is not None:
+            stats.seconds = time.perf_counter() - start
+            #every reached vertex is settled once and has all its edges scanned
+            reached = [v for v, d in enumerate(distances) if d != float('inf')]
+            stats.vertices = len(reached)
+            stats.edges = sum(len(self._out_edges(v, ordered=False)) for v in reached)
+            #the heap engine pushes once per scanned edge plus the source and pops until empty
+            if not buckets:
+                stats.pushes = stats.pops = stats.edges + 1
+            stats.stale = stats.pops - stats.vertices
+        if cache is not None:
+            cache.put(src, self.version, distances)
+        if stats is not None:
+            instrumentation.record(stats)
+        return distances
+
+
+    def _dijkstra_heap(self, src: int) -> []:
+        """
+        Dijkstra's algorithm with a binary heap as the priority queue
         """
         #logic is very similar to psuedo-code provided in lecture, utilizing a priority queue
         #initialize dictionary for visited vertices, and priority queue. Push start value into queue with weight 0
@@ -243,10 +982,9 @@ class DirectedGraph:
             if v not in visited_vertices:
                 visited_vertices[v] = d
 
-                for e in range(self.v_count):
-                    if self.adj_matrix[v][e] != 0:
-                        #if edge exists, add to queue and calculate distance as weight plus distances to v
-                        heapq.heappush(priority_queue, (self.adj_matrix[v][e] + d, e))
+                for e, weight in self._out_edges(v, ordered=False):
+                    #add each edge's endpoint to queue and calculate distance as weight plus distance to v
+                    heapq.heappush(priority_queue, (weight + d, e))
         #format output
         output_list = []
         for i in range(self.v_count):
@@ -258,6 +996,1012 @@ class DirectedGraph:
         return output_list
 
 
+    def enable_dijkstra_cache(self, max_bytes=64 * 1024 * 1024) -> None:
+        """
+        Turns on an LRU cache of dijkstra() results holding at most max_bytes of distances,
+        9 bytes per vertex per cached source plus small array headers. Passing max_bytes=0
+        turns the cache off.
+        """
+        self._dijkstra_cache = DistanceCache(max_bytes) if max_bytes > 0 else None
+
+
+    def dijkstra_cache_info(self):
+        """
+        Returns the cache statistics as a dictionary, or None if the cache is off
+        """
+        if self._dijkstra_cache is None:
+            return None
+        return self._dijkstra_cache.info()
+
+
+    def enable_instrumentation(self, callback=None) -> None:
+        """
+        Turns on per-call counters for dfs(), bfs(), has_cycle() and dijkstra(). After each
+        call a CallStats is passed to callback (if given) and added to the totals returned by
+        instrumentation_info(). When instrumentation is off each of these methods only pays
+        for one attribute check.
+        """
+        self._instrumentation = Instrumentation(callback)
+
+
+    def disable_instrumentation(self) -> None:
+        """
+        Turns instrumentation off and drops its totals
+        """
+        self._instrumentation = None
+
+
+    def instrumentation_info(self):
+        """
+        Returns the per-method totals as a dictionary, or None if instrumentation is off
+        """
+        if self._instrumentation is None:
+            return None
+        return self._instrumentation.info()
+
+
+    def _dijkstra_buckets(self, src: int, stats=None) -> []:
+        """
+        Dijkstra's algorithm with a bucket queue (Dial's algorithm). Every queued distance lies
+        within max weight of the distance being settled, so max weight + 1 buckets used as a
+        circular array hold the whole queue, and each step just moves to the next bucket.
+        If stats is given, the number of queue pushes and pops is stored in it.
+        """
+        n_buckets = int(self._max_weight) + 1
+        buckets = [[] for _ in range(n_buckets)]
+        distances = [float('inf')] * self.v_count
+        settled = bytearray(self.v_count)
+        distances[src] = 0
+        buckets[0].append(src)
+        #the queue is empty once every pushed entry has been popped
+        pushed = 1
+        popped = 0
+        d = 0
+        while pushed != popped:
+            bucket = buckets[d % n_buckets]
+            while len(bucket) != 0:
+                v = bucket.pop()
+                popped += 1
+                #skip entries left behind when a vertex was queued again at a shorter distance
+                if settled[v] or distances[v] != d:
+                    continue
+                settled[v] = 1
+                for e, weight in self._out_edges(v, ordered=False):
+                    if d + weight < distances[e]:
+                        distances[e] = d + weight
+                        #an integer-valued float weight such as 3.0 still needs an int index
+                        buckets[int(d + weight) % n_buckets].append(e)
+                        pushed += 1
+            d += 1
+        if stats is not None:
+            stats.pushes = pushed
+            stats.pops = popped
+        return distances
+
+
+    def shortest_path(self, src: int, dst: int, bidirectional=False):
+        """
+        Returns a tuple (distance, path) for the shortest path from SRC to DST, where path is
+        the list of vertices along it. The search stops as soon as DST is settled. With
+        bidirectional=True it searches forward from SRC and backward over reversed edges from
+        DST until the two searches meet. If DST is not reachable, returns (inf, []).
+        """
+        if src < 0 or src > self.v_count - 1 or dst < 0 or dst > self.v_count - 1:
+            return float('inf'), []
+        if src == dst:
+            return 0, [src]
+        if bidirectional:
+            return self._bidirectional_path(src, dst)
+        #same as dijkstra, but a vertex is only pushed when its distance improves, and the vertex
+        #each distance came from is recorded so the path can be rebuilt
+        distances = {src: 0}
+        previous = {src: None}
+        settled = set()
+        priority_queue = [(0, src)]
+        while len(priority_queue) != 0:
+            d, v = heapq.heappop(priority_queue)
+            if v in settled:
+                continue
+            settled.add(v)
+            if v == dst:
+                return d, self._trace_path(previous, dst)[::-1]
+            for e, weight in self._out_edges(v, ordered=False):
+                if e not in settled and d + weight < distances.get(e, float('inf')):
+                    distances[e] = d + weight
+                    previous[e] = v
+                    heapq.heappush(priority_queue, (d + weight, e))
+        return float('inf'), []
+
+
+    def _bidirectional_path(self, src: int, dst: int):
+        """
+        Bidirectional Dijkstra search used by shortest_path()
+        """
+        #index 0 is the forward search from src, index 1 the backward search from dst
+        distances = ({src: 0}, {dst: 0})
+        previous = ({src: None}, {dst: None})
+        settled = (set(), set())
+        queues = ([(0, src)], [(0, dst)])
+        neighbors = (self._out_edges, self._in_edges)
+        best, meet = float('inf'), None
+        #stop once the two smallest queued distances together cannot beat the best meeting point
+        while len(queues[0]) != 0 and len(queues[1]) != 0:
+            if queues[0][0][0] + queues[1][0][0] >= best:
+                break
+            side = 0 if queues[0][0][0] <= queues[1][0][0] else 1
+            d, v = heapq.heappop(queues[side])
+            if v in settled[side]:
+                continue
+            settled[side].add(v)
+            for e, weight in neighbors[side](v):
+                if e not in settled[side] and d + weight < distances[side].get(e, float('inf')):
+                    distances[side][e] = d + weight
+                    previous[side][e] = v
+                    heapq.heappush(queues[side], (d + weight, e))
+                #an edge reaching a vertex the other search has already seen may complete a shorter path
+                if e in distances[1 - side] and d + weight + distances[1 - side][e] < best:
+                    best = d + weight + distances[1 - side][e]
+                    meet = (v, e) if side == 0 else (e, v)
+        if meet is None:
+            return float('inf'), []
+        #meet is the edge joining the two halves: src ... meet[0] -> meet[1] ... dst
+        return best, self._trace_path(previous[0], meet[0])[::-1] + self._trace_path(previous[1], meet[1])
+
+
+    def _trace_path(self, previous: dict, v: int) -> []:
+        """
+        Follows the previous-vertex links from v back to the start of a search and returns
+        the vertices in that order
+        """
+        path = []
+        while v is not None:
+            path.append(v)
+            v = previous[v]
+        return path
+
+
+    def _csr(self):
+        """
+        Returns the graph in compressed-row form as three arrays: offsets (one per vertex plus
+        one), targets and weights. The edges leaving vertex v are at positions
+        offsets[v] to offsets[v + 1] - 1 of targets and weights. The arrays are rebuilt only
+        after the graph changes, so callers must not modify them
+        """
+        if self._csr_arrays is not None and self._csr_arrays[0] == self.version:
+            return self._csr_arrays[1:]
+        offsets = array('q', [0])
+        targets = array('q')
+        weights = array('d')
+        for v in range(self.v_count):
+            for dst, weight in self._out_edges(v, ordered=False):
+                targets.append(dst)
+                weights.append(weight)
+            offsets.append(len(targets))
+        self._csr_arrays = (self.version, offsets, targets, weights)
+        return offsets, targets, weights
+
+
+    def dijkstra_many(self, sources, processes=None) -> []:
+        """
+        Runs dijkstra from every vertex in SOURCES and returns one row of distances per source,
+        in the same order, as an array('d') (inf where unreachable; all inf for a source not
+        in the graph). Sources are split across a pool of PROCESSES worker processes (default:
+        one per CPU). The graph is copied once into shared memory in compressed-row form
+        (see graph_parallel.SharedArrays) and workers write distances straight into a
+        shared result matrix.
+        """
+        sources = list(sources)
+        offsets, targets, weights = self._csr()
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = max(1, min(processes, len(sources)))
+        #a single process gains nothing from shared memory, so run in this process instead
+        if processes == 1:
+            rows = []
+            for src in sources:
+                distances = [float('inf')] * self.v_count
+                if 0 <= src < self.v_count:
+                    _csr_dijkstra(offsets, targets, weights, src, distances)
+                rows.append(array('d', distances))
+            return rows
+        contents = [('q', offsets), ('q', targets), ('d', weights), ('d', len(sources) * self.v_count)]
+        with SharedArrays(contents) as shared:
+            #each worker handles several chunks so uneven source costs still balance out
+            tasks = list(enumerate(sources))
+            chunk = max(1, len(tasks) // (processes * 4))
+            chunks = [tasks[i:i + chunk] for i in range(0, len(tasks), chunk)]
+            with shared.pool(processes) as pool:
+                pool.map(_dijkstra_rows, chunks)
+            result = shared.views[3]
+            rows = []
+            for i in range(len(sources)):
+                row = array('d')
+                row.frombytes(result[i * self.v_count:(i + 1) * self.v_count].tobytes())
+                rows.append(row)
+            return rows
+
+
+    def save(self, path: str) -> None:
+        """
+        Writes the graph to path in the binary format of graph_io (compressed rows of
+        destinations and weights), which load() can memory-map
+        """
+        offsets = array('q', [0])
+        targets = array('q')
+        weights = array('q' if self._integer_weights else 'd')
+        #integer-valued floats such as 3.0 count as integer weights but 'q' needs ints
+        convert = int if self._integer_weights else float
+        for v in range(self.v_count):
+            for dst, weight in self._out_edges(v):
+                targets.append(dst)
+                weights.append(convert(weight))
+            offsets.append(len(targets))
+        write_graph(path, 0, offsets, targets, weights)
+
+
+    @classmethod
+    def from_edgelist(cls, source, chunk_size=100000, storage='matrix'):
+        """
+        Builds a graph from an edge list file (or iterable of lines) with one 'src dst [weight]'
+        edge per line, separated by whitespace or commas; weight defaults to 1. Lines are read
+        chunk_size at a time and edges are collected per vertex, then the storage is built
+        once at the end instead of calling add_vertex()/add_edge() per item. The result
+        matches the constructor: the graph gets max(0, largest index) + 1 vertices, so an
+        empty source still gives one vertex; edges that add_edge() would reject (loops,
+        non-positive weights, negative indices) are skipped; and a repeated edge keeps its
+        last weight. Lines that cannot be parsed raise ValueError.
+        """
+        graph = cls(storage=storage)
+        adjacency = []
+        max_weight = 0
+        integer_weights = True
+        for chunk in iter_edge_chunks(source, chunk_size):
+            try:
+                edges = [(line_number, int(fields[0]), int(fields[1]),
+                          _parse_weight(fields[2]) if len(fields) == 3 else 1)
+                         for line_number, fields in chunk if 2 <= len(fields) <= 3]
+            except ValueError:
+                edges = []
+            #the fast path above gives up on the whole chunk if any line is malformed; find it
+            if len(edges) != len(chunk):
+                for line_number, fields in chunk:
+                    try:
+                        if not 2 <= len(fields) <= 3:
+                            raise ValueError
+                        int(fields[0]), int(fields[1]), _parse_weight(fields[2] if len(fields) == 3 else 1)
+                    except ValueError:
+                        raise ValueError(f'line {line_number}: cannot parse edge {fields}') from None
+            top = max(max(src, dst) for _, src, dst, _ in edges)
+            if top >= len(adjacency):
+                adjacency.extend(dict() for _ in range(top + 1 - len(adjacency)))
+            for _, src, dst, weight in edges:
+                if src != dst and src >= 0 and dst >= 0 and weight >= 1:
+                    adjacency[src][dst] = weight
+                    if weight > max_weight:
+                        max_weight = weight
+                    if not _is_integer(weight):
+                        integer_weights = False
+        if len(adjacency) == 0:
+            adjacency.append(dict())
+        v_count = len(adjacency)
+        graph.v_count = v_count
+        graph._max_weight = max_weight
+        graph._integer_weights = integer_weights
+        if storage == 'sparse':
+            graph.adj_list = adjacency
+        elif storage == 'numpy':
+            dtype = np.int64 if integer_weights else np.float64
+            graph.adj_matrix = np.zeros((v_count, v_count), dtype=dtype)
+            for src, neighbors in enumerate(adjacency):
+                graph.adj_matrix[src, list(neighbors)] = list(neighbors.values())
+        else:
+            graph.adj_matrix = [[0] * v_count for _ in range(v_count)]
+            for src, neighbors in enumerate(adjacency):
+                row = graph.adj_matrix[src]
+                for dst, weight in neighbors.items():
+                    row[dst] = weight
+        return graph
+
+
+    @classmethod
+    def load(cls, path: str, mmap=True):
+        """
+        Reads a graph written by save(). With mmap=True the arrays are views of the
+        memory-mapped file, so loading is near-instant and processes loading the same file
+        share one read-only copy. The graph is copied into sparse storage the first time it
+        is changed.
+        """
+        data = read_graph(path, use_mmap=mmap)
+        if data['kind'] != 0:
+            raise ValueError(f'{path} does not hold a directed graph')
+        graph = cls(storage='sparse')
+        graph.storage = 'csr'
+        graph.adj_list = None
+        graph.csr = (data['offsets'], data['targets'], data['weights'])
+        graph.v_count = data['v_count']
+        graph._integer_weights = data['integer_weights']
+        graph._max_weight = int(data['max_weight']) if graph._integer_weights else data['max_weight']
+        return graph
+
+
+    def all_pairs_shortest_paths(self, processes=None) -> []:
+        """
+        Returns the matrix of shortest path lengths between every pair of vertices, where
+        row i is dijkstra(i), computed in parallel with dijkstra_many()
+        """
+        return self.dijkstra_many(range(self.v_count), processes)
+
+
+    def track_shortest_paths(self, src: int):
+        """
+        Returns a ShortestPathTree holding shortest path lengths from SRC. The tree stays
+        registered with the graph and is repaired incrementally by add_vertex(), add_edge()
+        and remove_edge() until untrack_shortest_paths() is called.
+        """
+        tree = ShortestPathTree(self, src)
+        self._trees.append(tree)
+        return tree
+
+
+    def untrack_shortest_paths(self, tree) -> None:
+        """
+        Stops updating a tree returned by track_shortest_paths()
+        """
+        if tree in self._trees:
+            self._trees.remove(tree)
+
+
+    def snapshot(self):
+        """
+        Returns a read-only DirectedGraphSnapshot of the graph as it is now. Creating it only
+        copies the list of rows: the rows themselves are shared, and this graph copies a row
+        the first time it changes it after the snapshot was taken (NumPy storage copies the
+        whole matrix on the first change). Call it from the thread that changes the graph,
+        for example after each batch of updates, and hand the snapshot to reader threads:
+        they can use it without locks while this graph keeps changing. Rows no snapshot
+        refers to any more are freed as usual
+        """
+        snapshot = DirectedGraphSnapshot.__new__(DirectedGraphSnapshot)
+        snapshot.__dict__.update(self.__dict__)
+        if self.storage == 'matrix':
+            snapshot.adj_matrix = list(self.adj_matrix)
+        elif self.storage == 'sparse':
+            snapshot.adj_list = list(self.adj_list)
+        #state the snapshot must not share with the live graph
+        snapshot._reverse = None
+        snapshot._dijkstra_cache = None
+        snapshot._trees = []
+        snapshot._instrumentation = None
+        snapshot._shared = None
+        #loaded graphs are read-only until copied by _materialize(), so share nothing to track
+        if self.storage != 'csr':
+            self._shared = bytearray(b'\x01') * self.v_count
+        return snapshot
+
+
+    def reversed(self):
+        """
+        Returns a new sparse DirectedGraph with every edge of this graph pointing the other way
+        """
+        graph = DirectedGraph(storage='sparse')
+        for _ in range(self.v_count):
+            graph.add_vertex()
+        for src, dst, weight in self.get_edges():
+            graph.add_edge(dst, src, weight)
+        return graph
+
+
+    def build_landmark_index(self, k=8):
+        """
+        Picks k landmark vertices and returns a LandmarkIndex for fast point-to-point
+        A* queries on this graph (see LandmarkIndex)
+        """
+        return LandmarkIndex(self, k)
+
+
+    def build_contraction_hierarchy(self, witness_limit=500):
+        """
+        Contracts this graph and returns a ContractionHierarchy for fast point-to-point
+        distance queries until the graph next changes (see ContractionHierarchy)
+        """
+        return ContractionHierarchy(self, witness_limit)
+
+
+class DirectedGraphSnapshot(DirectedGraph):
+    """
+    Read-only view of a DirectedGraph as it was when DirectedGraph.snapshot() was called.
+    All query methods work as on the graph itself; methods that would change it raise
+    TypeError
+    """
+
+    def _read_only(self, *args, **kwargs):
+        """
+        Raise TypeError in place of any method that would change the graph
+        """
+        raise TypeError('graph snapshots are read-only')
+
+    add_vertex = add_vertices = add_edge = remove_edge = _read_only
+    add_edges = remove_edges = batch = _read_only
+
+    def snapshot(self):
+        """
+        A snapshot never changes, so it is its own snapshot
+        """
+        return self
+
+
+class DirectedGraphBatch:
+    """
+    Changes to a DirectedGraph collected inside a with block and applied when it ends:
+
+        with graph.batch() as batch:
+            batch.add_vertex()
+            batch.add_edge(0, 1, 5)
+
+    The result is the same as making the calls on the graph in the same order, but each run
+    of vertex additions grows storage once, each run of edge changes is written by
+    add_edges(), and tracked shortest path trees are rebuilt once at the end. If the block
+    raises an exception nothing is applied
+    """
+
+    def __init__(self, graph):
+        """
+        Start with no pending changes. Each change is an int (a number of vertices to add)
+        or a (src, dst, weight) tuple, where weight None removes the edge
+        """
+        self.graph = graph
+        self.changes = []
+        self.v_count = graph.v_count
+
+    def __enter__(self):
+        """
+        Return the batch for use in the with block
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Apply the queued changes unless the block raised an exception
+        """
+        if exc_type is None:
+            self.apply()
+        return False
+
+    def add_vertex(self) -> int:
+        """
+        Queues a new vertex and returns the number of vertices the graph will have
+        """
+        if len(self.changes) != 0 and isinstance(self.changes[-1], int):
+            self.changes[-1] += 1
+        else:
+            self.changes.append(1)
+        self.v_count += 1
+        return self.v_count
+
+    def add_edge(self, src: int, dst: int, weight=1) -> None:
+        """
+        Queues add_edge(src, dst, weight)
+        """
+        self.changes.append((src, dst, weight))
+
+    def remove_edge(self, src: int, dst: int) -> None:
+        """
+        Queues remove_edge(src, dst)
+        """
+        self.changes.append((src, dst, None))
+
+    def apply(self) -> None:
+        """
+        Applies the queued changes to the graph in order and clears them
+        """
+        graph = self.graph
+        edges = []
+        for change in self.changes + [0]:
+            if isinstance(change, int):
+                #an edge may refer to a vertex queued before it, so apply edges up to here first
+                graph._apply_edges(edges, repair=False)
+                edges = []
+                graph.add_vertices(change)
+            else:
+                edges.append(change)
+        if len(self.changes) != 0:
+            for tree in graph._trees:
+                tree._rebuild()
+        self.changes = []
+        self.v_count = graph.v_count
+
+
+class ShortestPathTree:
+    """
+    Shortest path lengths and tree edges from one source vertex of a DirectedGraph, kept
+    up to date after each edge change by repairing only the vertices it affects. Created
+    with DirectedGraph.track_shortest_paths()
+    """
+
+    def __init__(self, graph, src: int):
+        """
+        Store the distance and tree parent of every vertex, plus each vertex's tree children
+        """
+        self.graph = graph
+        self.src = src
+        self._rebuild()
+
+    def distances(self) -> []:
+        """
+        Returns the current shortest path lengths, in the same form as DirectedGraph.dijkstra()
+        """
+        return list(self.dist)
+
+    def path_to(self, v: int) -> []:
+        """
+        Returns the current shortest path from the source to v as a list of vertices, or an
+        empty list if v is not reachable
+        """
+        if v < 0 or v >= len(self.dist) or self.dist[v] == float('inf'):
+            return []
+        path = []
+        while v is not None:
+            path.append(v)
+            v = self.parent[v]
+        return path[::-1]
+
+    def _rebuild(self) -> None:
+        """
+        Computes the whole tree from scratch, which is cheaper than repairing it edge by edge
+        after a batch of changes
+        """
+        v_count = self.graph.v_count
+        self.dist = [float('inf')] * v_count
+        self.parent = [None] * v_count
+        self.children = [set() for _ in range(v_count)]
+        if 0 <= self.src < v_count:
+            self.dist[self.src] = 0
+            self._propagate([(0, self.src)])
+
+    def _set_parent(self, v: int, parent) -> None:
+        """
+        Moves v under a new parent in the tree
+        """
+        if self.parent[v] is not None:
+            self.children[self.parent[v]].discard(v)
+        self.parent[v] = parent
+        if parent is not None:
+            self.children[parent].add(v)
+
+    def _propagate(self, priority_queue: []) -> None:
+        """
+        Dijkstra's algorithm continued from the queued (distance, vertex) entries, relaxing
+        edges only where they shorten a current distance
+        """
+        heapq.heapify(priority_queue)
+        while len(priority_queue) != 0:
+            d, v = heapq.heappop(priority_queue)
+            if d > self.dist[v]:
+                continue
+            for e, weight in self.graph._out_edges(v, ordered=False):
+                if d + weight < self.dist[e]:
+                    self.dist[e] = d + weight
+                    self._set_parent(e, v)
+                    heapq.heappush(priority_queue, (d + weight, e))
+
+    def _vertex_added(self) -> None:
+        """
+        A new vertex starts out unreachable
+        """
+        self.dist.append(float('inf'))
+        self.parent.append(None)
+        self.children.append(set())
+
+    def _edge_changed(self, u: int, v: int, old_weight, new_weight) -> None:
+        """
+        Repairs the tree after edge u -> v changed from old_weight to new_weight (0 means no edge)
+        """
+        #a new or cheaper edge can only shorten paths through v: relax it and continue from v
+        if new_weight != 0 and (old_weight == 0 or new_weight < old_weight):
+            if self.dist[u] + new_weight < self.dist[v]:
+                self.dist[v] = self.dist[u] + new_weight
+                self._set_parent(v, u)
+                self._propagate([(self.dist[v], v)])
+            return
+        #a removed or more expensive edge only matters if it is a tree edge, and then only for
+        #the subtree below it
+        if self.parent[v] != u or new_weight == old_weight:
+            return
+        affected = set()
+        stack = [v]
+        while len(stack) != 0:
+            vertex = stack.pop()
+            affected.add(vertex)
+            stack.extend(self.children[vertex])
+        for vertex in affected:
+            self.dist[vertex] = float('inf')
+            self._set_parent(vertex, None)
+        #each affected vertex restarts from its best edge out of the unaffected part of the tree
+        priority_queue = []
+        for vertex in affected:
+            for x, weight in self.graph._in_edges(vertex):
+                if x not in affected and self.dist[x] + weight < self.dist[vertex]:
+                    self.dist[vertex] = self.dist[x] + weight
+                    self._set_parent(vertex, x)
+            if self.dist[vertex] != float('inf'):
+                priority_queue.append((self.dist[vertex], vertex))
+        self._propagate(priority_queue)
+
+
+class LandmarkIndex:
+    """
+    ALT (A*, landmarks, triangle inequality) index for point-to-point shortest paths on a
+    DirectedGraph that does not change. For each landmark L it stores the distances from L
+    to every vertex and from every vertex to L. For any vertices v and t, d(L, t) - d(L, v)
+    and d(v, L) - d(t, L) are lower bounds on d(v, t), so their maximum is an admissible A*
+    heuristic. The index is tied to the graph version it was built at
+    """
+
+    def __init__(self, graph, k=8, landmarks=None, forward=None, backward=None):
+        """
+        Picks k landmarks by repeatedly taking the vertex farthest from those already chosen,
+        and computes their distance arrays with DirectedGraph.dijkstra(). Precomputed
+        landmarks and distance arrays can be passed in instead (as done by load()). The
+        distances are kept as one array('d') per landmark and direction
+        """
+        self.graph = graph
+        self.version = graph.version
+        start = time.perf_counter()
+        if landmarks is None:
+            landmarks, forward, backward = [], [], []
+            reverse = graph.reversed()
+            #vertices with no finite round trip to any landmark score inf, so they are picked first
+            spread = [float('inf')] * graph.v_count
+            for _ in range(min(k, graph.v_count)):
+                candidates = [v for v in range(graph.v_count) if v not in landmarks]
+                landmark = max(candidates, key=lambda v: (spread[v], -v))
+                landmarks.append(landmark)
+                forward.append(array('d', graph.dijkstra(landmark)))
+                backward.append(array('d', reverse.dijkstra(landmark)))
+                for v in range(graph.v_count):
+                    spread[v] = min(spread[v], forward[-1][v] + backward[-1][v])
+        self.landmarks = landmarks
+        self.forward = [array('d', row) for row in forward]
+        self.backward = [array('d', row) for row in backward]
+        self.build_seconds = time.perf_counter() - start
+        self.last_settled = 0
+
+    def memory_bytes(self) -> int:
+        """
+        Returns the size of the distance arrays in bytes
+        """
+        return sum(sys.getsizeof(row) for row in self.forward + self.backward)
+
+    def stats(self) -> dict:
+        """
+        Returns the number of landmarks, preprocessing time, memory use and the number of
+        vertices settled by the most recent query
+        """
+        return {'landmarks': len(self.landmarks), 'build_seconds': self.build_seconds,
+                'memory_bytes': self.memory_bytes(), 'last_settled': self.last_settled}
+
+    def lower_bound(self, v: int, t: int):
+        """
+        Returns the best landmark lower bound on the shortest path length from v to t.
+        inf means t is not reachable from v
+        """
+        inf = float('inf')
+        best = 0
+        for forward, backward in zip(self.forward, self.backward):
+            #a term is only usable when the subtracted distance is finite; an infinite result
+            #then proves there is no path at all
+            if forward[v] != inf:
+                best = max(best, forward[t] - forward[v])
+            if backward[t] != inf:
+                best = max(best, backward[v] - backward[t])
+        return best
+
+    def query(self, src: int, dst: int):
+        """
+        Returns a tuple (distance, path) for the shortest path from SRC to DST using A* search
+        guided by the landmark lower bounds, or (inf, []) if DST is not reachable
+        """
+        graph = self.graph
+        if graph.version != self.version:
+            raise ValueError('graph has changed since the landmark index was built')
+        self.last_settled = 0
+        if src < 0 or src > graph.v_count - 1 or dst < 0 or dst > graph.v_count - 1:
+            return float('inf'), []
+        if self.lower_bound(src, dst) == float('inf'):
+            return float('inf'), []
+        distances = {src: 0}
+        previous = {src: None}
+        settled = set()
+        priority_queue = [(self.lower_bound(src, dst), src)]
+        while len(priority_queue) != 0:
+            _, v = heapq.heappop(priority_queue)
+            if v in settled:
+                continue
+            settled.add(v)
+            self.last_settled += 1
+            if v == dst:
+                return distances[v], graph._trace_path(previous, dst)[::-1]
+            for e, weight in graph._out_edges(v, ordered=False):
+                d = distances[v] + weight
+                if e not in settled and d < distances.get(e, float('inf')):
+                    bound = self.lower_bound(e, dst)
+                    if bound == float('inf'):
+                        continue
+                    distances[e] = d
+                    previous[e] = v
+                    heapq.heappush(priority_queue, (d + bound, e))
+        return float('inf'), []
+
+    def save(self, path: str) -> None:
+        """
+        Writes the landmarks and distance arrays to a JSON file
+        """
+        with open(path, 'w') as file:
+            json.dump({'format': 'landmark-index', 'v_count': self.graph.v_count,
+                       'landmarks': self.landmarks,
+                       'forward': [row.tolist() for row in self.forward],
+                       'backward': [row.tolist() for row in self.backward]}, file)
+
+    @classmethod
+    def load(cls, path: str, graph):
+        """
+        Reads an index written by save() and attaches it to GRAPH, which must be the graph
+        the index was built from
+        """
+        with open(path) as file:
+            data = json.load(file)
+        if data.get('format') != 'landmark-index' or data['v_count'] != graph.v_count:
+            raise ValueError(f'{path} is not a landmark index for this graph')
+        return cls(graph, landmarks=data['landmarks'], forward=data['forward'],
+                   backward=data['backward'])
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy built from a snapshot of a DirectedGraph. Vertices are contracted
+    one at a time in order of importance; contracting v adds a shortcut u -> w for each path
+    u -> v -> w that has no equally short path (witness) avoiding v. Afterwards every shortest
+    path can be found by searching only edges that lead to later-contracted (higher ranked)
+    vertices, forward from the source and backward from the destination. As with
+    LandmarkIndex, the hierarchy is tied to the graph version it was built at
+    """
+
+    def __init__(self, graph, witness_limit=500):
+        """
+        Store each vertex's rank (contraction order) and its upward edges in both directions:
+        up[v] holds (w, weight) for edges v -> w and down[v] holds (u, weight) for edges
+        u -> v, where w and u are ranked above v. witness_limit caps how many vertices each
+        witness search may settle; a search that hits the cap simply adds the shortcut
+        """
+        start = time.perf_counter()
+        v_count = graph.v_count
+        self.graph = graph
+        self.version = graph.version
+        self.v_count = v_count
+        self.witness_limit = witness_limit
+        #remaining (not yet contracted) graph, with shortcuts, in both directions
+        self._out = [dict(graph._out_edges(v, ordered=False)) for v in range(v_count)]
+        self._in = [dict() for _ in range(v_count)]
+        for v in range(v_count):
+            for w, weight in self._out[v].items():
+                self._in[w][v] = weight
+        self.rank = [0] * v_count
+        self.up = [[] for _ in range(v_count)]
+        self.down = [[] for _ in range(v_count)]
+        self.shortcut_count = 0
+        self.last_settled = 0
+        contracted_neighbors = [0] * v_count
+
+        #lazy ordering: a vertex's priority is recomputed when popped and it is put back if it
+        #is no longer the smallest. Priority is the edge difference (shortcuts added minus edges
+        #removed) plus the number of already contracted neighbors, which spreads contraction out
+        priority_queue = []
+        for v in range(v_count):
+            shortcuts = self._shortcuts(v)
+            priority_queue.append((self._priority(v, shortcuts, contracted_neighbors), v))
+        heapq.heapify(priority_queue)
+        order = 0
+        while len(priority_queue) != 0:
+            _, v = heapq.heappop(priority_queue)
+            shortcuts = self._shortcuts(v)
+            priority = self._priority(v, shortcuts, contracted_neighbors)
+            if len(priority_queue) != 0 and priority > priority_queue[0][0]:
+                heapq.heappush(priority_queue, (priority, v))
+                continue
+            self.rank[v] = order
+            order += 1
+            #every remaining neighbor is contracted later, so all of v's edges point upward
+            for w, weight in self._out[v].items():
+                self.up[v].append((w, weight))
+                del self._in[w][v]
+                contracted_neighbors[w] += 1
+            for u, weight in self._in[v].items():
+                self.down[v].append((u, weight))
+                del self._out[u][v]
+                contracted_neighbors[u] += 1
+            self._out[v] = dict()
+            self._in[v] = dict()
+            for u, w, weight in shortcuts:
+                if weight < self._out[u].get(w, float('inf')):
+                    self._out[u][w] = weight
+                    self._in[w][u] = weight
+                    self.shortcut_count += 1
+        del self._out, self._in
+        self.build_seconds = time.perf_counter() - start
+
+    def _priority(self, v: int, shortcuts: [], contracted_neighbors: []) -> int:
+        """
+        Returns the contraction priority of v (smaller is contracted first)
+        """
+        return len(shortcuts) - len(self._out[v]) - len(self._in[v]) + contracted_neighbors[v]
+
+    def _shortcuts(self, v: int) -> []:
+        """
+        Returns the (u, w, weight) shortcuts that contracting v would need
+        """
+        shortcuts = []
+        for u, weight_in in self._in[v].items():
+            targets = {w: weight_in + weight_out for w, weight_out in self._out[v].items() if w != u}
+            if len(targets) == 0:
+                continue
+            witness = self._witness_search(u, v, max(targets.values()), targets)
+            for w, weight in targets.items():
+                if witness.get(w, float('inf')) > weight:
+                    shortcuts.append((u, w, weight))
+        return shortcuts
+
+    def _witness_search(self, u: int, skip: int, limit, targets: dict) -> dict:
+        """
+        Dijkstra from u over the remaining graph without vertex skip, stopping once distances
+        exceed limit, every target is settled, or witness_limit vertices are settled.
+        Returns the distances found
+        """
+        distances = {u: 0}
+        settled = set()
+        remaining = len(targets)
+        priority_queue = [(0, u)]
+        while len(priority_queue) != 0 and len(settled) < self.witness_limit:
+            d, v = heapq.heappop(priority_queue)
+            if d > limit:
+                break
+            if v in settled:
+                continue
+            settled.add(v)
+            if v in targets:
+                remaining -= 1
+                if remaining == 0:
+                    break
+            for e, weight in self._out[v].items():
+                if e != skip and d + weight < distances.get(e, float('inf')):
+                    distances[e] = d + weight
+                    heapq.heappush(priority_queue, (d + weight, e))
+        return distances
+
+    def stats(self) -> dict:
+        """
+        Returns preprocessing time, number of shortcuts added and the number of vertices
+        settled by the most recent query
+        """
+        return {'build_seconds': self.build_seconds, 'shortcuts': self.shortcut_count,
+                'last_settled': self.last_settled}
+
+    def query(self, src: int, dst: int):
+        """
+        Returns the length of the shortest path from SRC to DST (inf if unreachable), equal to
+        dijkstra(SRC)[DST]. Raises ValueError if the graph has changed since the hierarchy was built
+        """
+        if self.graph.version != self.version:
+            raise ValueError('graph has changed since the contraction hierarchy was built')
+        self.last_settled = 0
+        if src < 0 or src > self.v_count - 1 or dst < 0 or dst > self.v_count - 1:
+            return float('inf')
+        #index 0 searches upward from src, index 1 upward over reversed edges from dst
+        distances = ({src: 0}, {dst: 0})
+        settled = (set(), set())
+        queues = ([(0, src)], [(0, dst)])
+        edges = (self.up, self.down)
+        best = float('inf')
+        while len(queues[0]) != 0 or len(queues[1]) != 0:
+            if len(queues[1]) == 0 or (len(queues[0]) != 0 and queues[0][0][0] <= queues[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            d, v = heapq.heappop(queues[side])
+            #a direction whose next distance cannot improve the best path is finished
+            if d >= best:
+                queues[side].clear()
+                continue
+            if v in settled[side]:
+                continue
+            settled[side].add(v)
+            self.last_settled += 1
+            if v in distances[1 - side]:
+                best = min(best, d + distances[1 - side][v])
+            for e, weight in edges[side][v]:
+                if d + weight < distances[side].get(e, float('inf')):
+                    distances[side][e] = d + weight
+                    heapq.heappush(queues[side], (d + weight, e))
+        return best
+
+
+def _is_integer(weight) -> bool:
+    """
+    Returns True if an edge weight has an integer value (3 or 3.0). inf and NaN do not, so
+    they only keep dijkstra() off the bucket queue
+    """
+    return isinstance(weight, int) or float(weight).is_integer()
+
+
+def _parse_weight(field):
+    """
+    Returns an edge weight read from a text field: an int if it is written as one,
+    otherwise a float
+    """
+    if isinstance(field, str):
+        try:
+            return int(field)
+        except ValueError:
+            return float(field)
+    return field
+
+
+def _bit_indices(bits: int) -> []:
+    """
+    Returns the positions of the set bits of a Python int in ascending order, reading them
+    from its binary string so the int is not shifted once per bit
+    """
+    digits = bin(bits)[:1:-1]
+    indices = []
+    i = digits.find('1')
+    while i != -1:
+        indices.append(i)
+        i = digits.find('1', i + 1)
+    return indices
+
+
+def _bits_from_indices(indices, size: int) -> int:
+    """
+    Returns a Python int with the bits at the given positions set
+    """
+    packed = bytearray((size + 7) // 8)
+    for i in indices:
+        packed[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(packed, 'little')
+
+
+def _dijkstra_rows(tasks) -> None:
+    """
+    Pool task: runs dijkstra for each (row, src) pair and writes the distances into that
+    row of the shared result matrix
+    """
+    offsets, targets, weights, result = worker_arrays()
+    v_count = len(offsets) - 1
+    for row, src in tasks:
+        distances = [float('inf')] * v_count
+        if 0 <= src < v_count:
+            _csr_dijkstra(offsets, targets, weights, src, distances)
+        result[row * v_count:(row + 1) * v_count] = array('d', distances)
+
+
+def _csr_dijkstra(offsets, targets, weights, src: int, distances: []) -> None:
+    """
+    Dijkstra's algorithm over a compressed-row graph. DISTANCES must hold inf for every
+    vertex; it is filled in place
+    """
+    distances[src] = 0
+    priority_queue = [(0, src)]
+    while len(priority_queue) != 0:
+        d, v = heapq.heappop(priority_queue)
+        #skip entries left behind when a vertex was queued again at a shorter distance
+        if d > distances[v]:
+            continue
+        for k in range(offsets[v], offsets[v + 1]):
+            e = targets[k]
+            if d + weights[k] < distances[e]:
+                distances[e] = d + weights[k]
+                heapq.heappush(priority_queue, (distances[e], e))
+
+
 
 
 
@@ -0,0 +1,164 @@
+# Description: Compact binary file format shared by DirectedGraph and UndirectedGraph
+
+import mmap
+import struct
+import sys
+from array import array
+
+# File layout (all integers little-endian):
+#   header: magic b'GRPH', format version (u16), kind (u8: 0 directed, 1 undirected),
+#           weight type (u8: 0 none, 1 int64, 2 float64), vertex count, edge entry count,
+#           name blob size (u64 each), largest weight (float64)
+#   offsets: int64[vertex count + 1], edges leaving vertex v are entries offsets[v] to offsets[v + 1] - 1
+#   targets: int64[edge entry count], sorted ascending within each vertex
+#   weights: int64 or float64[edge entry count], only if weight type is not 0
+#   names:   int64[vertex count + 1] offsets into a UTF-8 blob, then the blob, for undirected
+#            graphs only. Names are stored in sorted order, so vertex ids follow name order
+MAGIC = b'GRPH'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHBBQQQd')
+WEIGHT_TYPES = {0: None, 1: 'q', 2: 'd'}
+
+
+class NameTable:
+    """
+    Read-only table of vertex names stored in a graph file, looked up by binary search so no
+    dictionary has to be built when a file is loaded
+    """
+
+    def __init__(self, offsets, blob):
+        """
+        Store the name offsets and the UTF-8 blob they point into
+        """
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        """
+        Return number of names
+        """
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        """
+        Return the name with id i
+        """
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def index(self, name: str) -> int:
+        """
+        Return the id of name, or -1 if it is not in the table
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self[low] == name:
+            return low
+        return -1
+
+
+def write_graph(path: str, kind: int, offsets, targets, weights=None, names=None) -> None:
+    """
+    Writes a graph in compressed-row form to path. offsets and targets are array('q'),
+    weights an array('q') or array('d') (or None) and names a sorted list of strings (or None)
+    """
+    max_weight = max(weights) if weights else 0
+    weight_type = 0 if weights is None else (1 if weights.typecode == 'q' else 2)
+    name_offsets = array('q', [0])
+    blob = bytearray()
+    for name in names or []:
+        blob += name.encode('utf-8')
+        name_offsets.append(len(blob))
+    sections = [offsets, targets]
+    if weights is not None:
+        sections.append(weights)
+    if names is not None:
+        sections.append(name_offsets)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, kind, weight_type,
+                               len(offsets) - 1, len(targets), len(blob), max_weight))
+        for section in sections:
+            #arrays are written in host byte order, so swap a copy on big-endian hosts
+            if sys.byteorder != 'little':
+                section = array(section.typecode, section)
+                section.byteswap()
+            file.write(section.tobytes())
+        file.write(blob)
+
+
+def read_graph(path: str, use_mmap=True) -> dict:
+    """
+    Reads a file written by write_graph(). With use_mmap=True the arrays are read-only views
+    of a memory-mapped file, so processes loading the same file share one copy in the page
+    cache. Returns a dictionary with kind, v_count, offsets, targets, weights, max_weight,
+    integer_weights and names (a NameTable or None)
+    """
+    with open(path, 'rb') as file:
+        if use_mmap:
+            buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        else:
+            buffer = memoryview(file.read())
+    magic, version, kind, weight_type, v_count, e_count, blob_size, max_weight = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a graph file')
+    if version != FORMAT_VERSION:
+        raise ValueError(f'{path} has unsupported format version {version}')
+    position = HEADER.size
+
+    def section(typecode, count):
+        nonlocal position
+        view = buffer[position:position + count * 8].cast(typecode)
+        position += count * 8
+        #views can only be used directly when the file byte order matches the host
+        if sys.byteorder != 'little':
+            view = array(typecode, view)
+            view.byteswap()
+        return view
+
+    offsets = section('q', v_count + 1)
+    targets = section('q', e_count)
+    weights = None
+    if WEIGHT_TYPES[weight_type] is not None:
+        weights = section(WEIGHT_TYPES[weight_type], e_count)
+    names = None
+    if kind == 1:
+        name_offsets = section('q', v_count + 1)
+        names = NameTable(name_offsets, buffer[position:position + blob_size])
+    return {'kind': kind, 'v_count': v_count, 'offsets': offsets, 'targets': targets,
+            'weights': weights, 'max_weight': max_weight, 'integer_weights': weight_type != 2,
+            'names': names}
+
+
+def iter_edge_chunks(source, chunk_size=100000):
+    """
+    Streams an edge list and yields it in chunks of at most chunk_size rows. source is a file
+    path, an open text file or any iterable of lines; each line holds the fields of one edge
+    separated by commas or whitespace, and blank lines and lines starting with '#' are
+    skipped. Items of the iterable that are not strings (such as tuples) are taken as
+    already split. Each row is a (line number, fields) tuple so callers can report errors
+    """
+    if isinstance(source, str):
+        with open(source) as file:
+            yield from iter_edge_chunks(file, chunk_size)
+        return
+    chunk = []
+    for line_number, line in enumerate(source, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if isinstance(line, str):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.split(',')] if ',' in line else line.split()
+        else:
+            fields = list(line)
+        chunk.append((line_number, fields))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) != 0:
+        yield chunk
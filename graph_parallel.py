@@ -0,0 +1,196 @@
+# Description: Shared memory arrays for worker pools, and the level-synchronous parallel
+# breadth-first search used by DirectedGraph and UndirectedGraph
+
+import os
+from array import array
+from multiprocessing import Pool, shared_memory
+
+#frontiers smaller than this are expanded in the calling process, where it costs less than
+#handing them to the pool
+PARALLEL_MIN_FRONTIER = 4096
+
+#shared memory blocks and views a pool worker attaches to once, in _attach_shared()
+_worker_state = dict()
+
+
+class SharedArrays:
+    """
+    Arrays copied into shared memory, one block per array, for a pool of worker processes
+    to read and write without copying. Use it in a with block; the blocks are unlinked when
+    the block ends. views holds one memoryview per array in the calling process, and pool()
+    starts workers that find the same arrays through worker_arrays()
+    """
+
+    def __init__(self, contents):
+        """
+        CONTENTS is a list of (typecode, data) pairs, where typecode is 'q' or 'd' and data
+        is a sequence to copy or, for a zero-filled array, its length
+        """
+        self.blocks = []
+        self.views = []
+        self.specs = []
+        #every view made, including the casts the sliced views are taken from
+        self._all_views = []
+        try:
+            for typecode, data in contents:
+                length = data if isinstance(data, int) else len(data)
+                #shared memory blocks cannot be empty, so each holds at least one 8-byte value
+                block = shared_memory.SharedMemory(create=True, size=max(8, length * 8))
+                self.blocks.append(block)
+                cast = block.buf.cast(typecode)
+                view = cast[:length]
+                self._all_views += [cast, view]
+                if not isinstance(data, int):
+                    if not isinstance(data, array) or data.typecode != typecode:
+                        data = array(typecode, data)
+                    view[:] = data
+                self.views.append(view)
+                self.specs.append((block.name, typecode, length))
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        """
+        Returns the arrays themselves
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Frees the shared memory
+        """
+        self.close()
+
+    def pool(self, processes: int):
+        """
+        Returns a Pool of PROCESSES workers, each attached to these arrays
+        """
+        return Pool(processes, initializer=_attach_shared, initargs=(self.specs,))
+
+    def close(self) -> None:
+        """
+        Releases the views and unlinks every block
+        """
+        #views into a block must be released before the block can be closed
+        for view in reversed(self._all_views):
+            view.release()
+        self._all_views = []
+        self.views = []
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def _attach_shared(specs) -> None:
+    """
+    Pool initializer: attaches to the blocks of a SharedArrays
+    """
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    _worker_state['blocks'] = blocks
+    _worker_state['arrays'] = [block.buf.cast(typecode)[:length]
+                               for block, (_, typecode, length) in zip(blocks, specs)]
+
+
+def worker_arrays() -> []:
+    """
+    In a worker started by SharedArrays.pool(), returns the shared arrays in the order
+    they were given
+    """
+    return _worker_state['arrays']
+
+
+def parallel_bfs_levels(offsets, targets, src: int, processes=None) -> array:
+    """
+    Breadth-first search over a compressed-row graph (the neighbors of vertex v are
+    targets[offsets[v]] to targets[offsets[v + 1] - 1]). Returns an array('q') holding the
+    number of hops from src to each vertex, or -1 where a vertex is not reachable.
+
+    The search goes one level at a time. The graph, the levels and the current frontier are
+    copied into shared memory, and each frontier with at least PARALLEL_MIN_FRONTIER
+    vertices is split across a pool of PROCESSES workers (default: one per CPU). The levels
+    array doubles as the shared visited map: a worker claims a vertex by writing the current
+    level into it. Two workers may claim the same vertex in the same level; both write the
+    same value, and the duplicate is dropped when their next frontiers are merged, so the
+    levels always match a sequential search
+    """
+    v_count = len(offsets) - 1
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if src < 0 or src > v_count - 1:
+        return array('q', [-1]) * v_count
+    #with one process there is no pool to share the arrays with, so search them where they are
+    if processes == 1:
+        levels = array('q', [-1]) * v_count
+        _search(offsets, targets, levels, src, None, None, processes)
+        return levels
+    contents = [('q', offsets), ('q', targets), ('q', array('q', [-1]) * v_count), ('q', v_count)]
+    with SharedArrays(contents) as shared:
+        shared_offsets, shared_targets, shared_levels, shared_frontier = shared.views
+        pool = None
+
+        def start_pool():
+            nonlocal pool
+            if pool is None:
+                pool = shared.pool(processes)
+            return pool
+
+        try:
+            _search(shared_offsets, shared_targets, shared_levels, src, shared_frontier, start_pool, processes)
+            return array('q', shared_levels)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+
+def _search(offsets, targets, levels, src: int, shared_frontier, start_pool, processes) -> None:
+    """
+    The level loop of parallel_bfs_levels(). Large frontiers are written to shared_frontier
+    and expanded by the pool returned from start_pool(); without a pool every level is
+    expanded here
+    """
+    levels[src] = 0
+    frontier = array('q', [src])
+    level = 0
+    while len(frontier) != 0:
+        level += 1
+        if start_pool is None or len(frontier) < PARALLEL_MIN_FRONTIER:
+            frontier = _expand(offsets, targets, levels, frontier, level)
+            continue
+        shared_frontier[:len(frontier)] = frontier
+        #about four ranges per worker, so a range of high-degree vertices does not hold up the level
+        step = max(1, len(frontier) // (processes * 4))
+        tasks = [(start, min(start + step, len(frontier)), level) for start in range(0, len(frontier), step)]
+        claimed = set()
+        frontier = array('q')
+        for found in start_pool().map(_expand_range, tasks):
+            for v in found:
+                if v not in claimed:
+                    claimed.add(v)
+                    frontier.append(v)
+
+
+def _expand(offsets, targets, levels, frontier, level: int) -> array:
+    """
+    Claims every unvisited neighbor of the frontier vertices for level and returns them
+    """
+    found = array('q')
+    for v in frontier:
+        for k in range(offsets[v], offsets[v + 1]):
+            e = targets[k]
+            if levels[e] == -1:
+                levels[e] = level
+                found.append(e)
+    return found
+
+
+def _expand_range(task) -> array:
+    """
+    Pool task: expands frontier positions start to end - 1 for level and returns the
+    vertices it claimed
+    """
+    start, end, level = task
+    offsets, targets, levels, frontier = worker_arrays()
+    return _expand(offsets, targets, levels, frontier[start:end], level)
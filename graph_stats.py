@@ -0,0 +1,78 @@
+# Description: Per-call counters recorded by DirectedGraph and UndirectedGraph when instrumentation is on
+
+
+class CallStats:
+    """
+    Counters for one call of an instrumented method. vertices counts vertices visited (or
+    settled, for dijkstra), edges counts edges scanned, and pushes, pops and stale count
+    priority queue entries added, removed and skipped because their vertex was already
+    settled (dijkstra only). seconds is the wall time of the call, not counting the time
+    spent working out the counters
+    """
+    __slots__ = ('method', 'vertices', 'edges', 'pushes', 'pops', 'stale', 'seconds')
+
+    def __init__(self, method: str, seconds=0.0):
+        """
+        Start all counters for a call of method at zero
+        """
+        self.method = method
+        self.vertices = 0
+        self.edges = 0
+        self.pushes = 0
+        self.pops = 0
+        self.stale = 0
+        self.seconds = seconds
+
+    def as_dict(self) -> dict:
+        """
+        Return the counters as a dictionary
+        """
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        """
+        Return the counters in human-readable form
+        """
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)
+        return f'CallStats({fields})'
+
+
+class Instrumentation:
+    """
+    Collects the CallStats of every instrumented call on one graph. Each call is handed to
+    callback (if given) as soon as it finishes and added to running totals per method
+    """
+
+    def __init__(self, callback=None):
+        """
+        Store the callback and start with no totals
+        """
+        self.callback = callback
+        self.totals = dict()
+
+    def record(self, stats: CallStats) -> None:
+        """
+        Adds one call to the totals of its method and passes it to the callback
+        """
+        totals = self.totals.get(stats.method)
+        if totals is None:
+            totals = self.totals[stats.method] = {'calls': 0, 'vertices': 0, 'edges': 0, 'pushes': 0,
+                                                  'pops': 0, 'stale': 0, 'seconds': 0.0}
+        totals['calls'] += 1
+        for field in ('vertices', 'edges', 'pushes', 'pops', 'stale', 'seconds'):
+            totals[field] += getattr(stats, field)
+        if self.callback is not None:
+            self.callback(stats)
+
+    def info(self) -> dict:
+        """
+        Returns a copy of the totals, a dictionary mapping method name to a dictionary of
+        summed counters and the number of calls
+        """
+        return {method: dict(totals) for method, totals in self.totals.items()}
+
+    def reset(self) -> None:
+        """
+        Clears the totals
+        """
+        self.totals.clear()
@@ -4,9 +4,390 @@
 # Description: Implementation of an undirected graph and associated functions
 
 
+import bisect
 import heapq
+import time
+from array import array
 from collections import deque
 
+from graph_io import iter_edge_chunks, read_graph, write_graph
+from graph_parallel import parallel_bfs_levels
+from graph_stats import CallStats, Instrumentation
+
+
+class MappedAdjacency:
+    """
+    Read-only dictionary-like adjacency list over the arrays of a graph file, so a graph
+    loaded with UndirectedGraph.load() needs no per-vertex Python objects. Vertex ids follow
+    sorted name order, so each neighbor list comes out sorted
+    """
+
+    def __init__(self, names, offsets, targets):
+        """
+        Store the name table and the compressed-row neighbor id arrays
+        """
+        self.names = names
+        self.offsets = offsets
+        self.targets = targets
+
+    def __len__(self):
+        """
+        Return number of vertices
+        """
+        return len(self.names)
+
+    def __iter__(self):
+        """
+        Iterate over vertex names in sorted order
+        """
+        for i in range(len(self.names)):
+            yield self.names[i]
+
+    def __contains__(self, v) -> bool:
+        """
+        Return True if v is a vertex name
+        """
+        return isinstance(v, str) and self.names.index(v) != -1
+
+    def __getitem__(self, v: str) -> []:
+        """
+        Return the sorted list of v's neighbor names
+        """
+        i = self.names.index(v) if isinstance(v, str) else -1
+        if i == -1:
+            raise KeyError(v)
+        return [self.names[j] for j in self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+    def get(self, v, default=None):
+        """
+        Return v's neighbor names, or default if v is not a vertex
+        """
+        try:
+            return self[v]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """
+        Iterate over vertex names
+        """
+        return iter(self)
+
+    def values(self):
+        """
+        Iterate over neighbor name lists
+        """
+        for v in self:
+            yield self[v]
+
+    def items(self):
+        """
+        Iterate over (name, neighbor names) pairs
+        """
+        for v in self:
+            yield v, self[v]
+
+
+class InternedAdjacency:
+    """
+    Dictionary-like adjacency list that interns each vertex name once as a dense integer id
+    and keeps each neighbor list as a compact array of 4-byte ids instead of a list of string
+    references. Rows are kept sorted by neighbor name, and ids are turned back into names
+    only when a neighbor list is read through the dictionary interface
+    """
+    __slots__ = ('ids', 'names', 'neighbors', 'free')
+
+    def __init__(self):
+        """
+        Start with no vertices. ids maps names to ids, names and neighbors are indexed by id
+        and free holds the ids of removed vertices so they can be reused
+        """
+        self.ids = dict()
+        self.names = []
+        self.neighbors = []
+        self.free = []
+
+    def __len__(self):
+        """
+        Return number of vertices
+        """
+        return len(self.ids)
+
+    def __iter__(self):
+        """
+        Iterate over vertex names in the order they were added
+        """
+        return iter(self.ids)
+
+    def __contains__(self, v) -> bool:
+        """
+        Return True if v is a vertex name
+        """
+        return v in self.ids
+
+    def __getitem__(self, v: str) -> []:
+        """
+        Return the sorted list of v's neighbor names
+        """
+        names = self.names
+        return [names[i] for i in self.neighbors[self.ids[v]]]
+
+    def get(self, v, default=None):
+        """
+        Return v's neighbor names, or default if v is not a vertex
+        """
+        if v not in self.ids:
+            return default
+        return self[v]
+
+    def keys(self):
+        """
+        Iterate over vertex names
+        """
+        return iter(self.ids)
+
+    def values(self):
+        """
+        Iterate over neighbor name lists
+        """
+        for v in self.ids:
+            yield self[v]
+
+    def items(self):
+        """
+        Iterate over (name, neighbor names) pairs
+        """
+        for v in self.ids:
+            yield v, self[v]
+
+    def degree(self, v: str) -> int:
+        """
+        Return the number of neighbors of v
+        """
+        return len(self.neighbors[self.ids[v]])
+
+    def add_vertex(self, v: str) -> int:
+        """
+        Interns v if it is new and returns its id
+        """
+        i = self.ids.get(v)
+        if i is not None:
+            return i
+        if len(self.free) != 0:
+            i = self.free.pop()
+            self.names[i] = v
+        else:
+            i = len(self.names)
+            self.names.append(v)
+            self.neighbors.append(array('I'))
+        self.ids[v] = i
+        return i
+
+    def _position(self, row, v: str) -> int:
+        """
+        Returns the index of name v in a row of ids, or -1 if it is not there
+        """
+        names = self.names
+        i = bisect.bisect_left(row, v, key=names.__getitem__)
+        if i < len(row) and names[row[i]] == v:
+            return i
+        return -1
+
+    def has_edge(self, u: str, v: str) -> bool:
+        """
+        Return True if u is a vertex with an edge to v
+        """
+        i = self.ids.get(u)
+        if i is None:
+            return False
+        return self._position(self.neighbors[i], v) != -1
+
+    def add_edge(self, u: str, v: str) -> None:
+        """
+        Adds an edge between two existing vertices that are not yet adjacent
+        """
+        i, j = self.ids[u], self.ids[v]
+        key = self.names.__getitem__
+        bisect.insort(self.neighbors[i], j, key=key)
+        bisect.insort(self.neighbors[j], i, key=key)
+
+    def remove_edge(self, u: str, v: str) -> None:
+        """
+        Removes an existing edge between u and v
+        """
+        row_u, row_v = self.neighbors[self.ids[u]], self.neighbors[self.ids[v]]
+        del row_u[self._position(row_u, v)]
+        del row_v[self._position(row_v, u)]
+
+    def add_neighbors(self, new: dict) -> int:
+        """
+        Merges sets of new neighbor names into the rows of existing vertices, re-sorting each
+        row once, and returns the number of row entries added
+        """
+        ids, names = self.ids, self.names
+        added = 0
+        for v, neighbors in new.items():
+            i = ids[v]
+            row = self.neighbors[i]
+            fresh = {ids[u] for u in neighbors}.difference(row)
+            if len(fresh) != 0:
+                added += len(fresh)
+                self.neighbors[i] = array('I', sorted(row.tolist() + list(fresh), key=names.__getitem__))
+        return added
+
+    def remove_neighbors(self, gone: dict) -> int:
+        """
+        Drops sets of neighbor names from the rows of existing vertices in one pass over each
+        row, and returns the number of row entries removed
+        """
+        ids = self.ids
+        removed = 0
+        for v, neighbors in gone.items():
+            i = ids[v]
+            row = self.neighbors[i]
+            drop = {ids[u] for u in neighbors}
+            kept = array('I', [u for u in row if u not in drop])
+            removed += len(row) - len(kept)
+            self.neighbors[i] = kept
+        return removed
+
+    def append_edges(self, edges) -> None:
+        """
+        Interns the names of a sequence of (u, v) edges and appends each end's id to the
+        other's row, skipping loops. Rows are left unsorted and may hold repeats until
+        sort_rows() is called, so a large edge list can be added chunk by chunk without
+        first collecting it into name-keyed sets
+        """
+        add_vertex, neighbors = self.add_vertex, self.neighbors
+        for u, v in edges:
+            if u != v:
+                i, j = add_vertex(u), add_vertex(v)
+                neighbors[i].append(j)
+                neighbors[j].append(i)
+
+    def sort_rows(self) -> int:
+        """
+        Drops repeated ids from every row and sorts it by neighbor name, after
+        append_edges(). Returns the number of edges
+        """
+        key = self.names.__getitem__
+        entries = 0
+        for i in self.ids.values():
+            row = self.neighbors[i]
+            self.neighbors[i] = row = array('I', sorted(set(row), key=key))
+            entries += len(row)
+        return entries // 2
+
+    def copy(self):
+        """
+        Returns a new table with its own name and id tables that shares this table's neighbor
+        arrays, for UndirectedGraph.snapshot()
+        """
+        table = InternedAdjacency()
+        table.ids = dict(self.ids)
+        table.names = list(self.names)
+        table.neighbors = list(self.neighbors)
+        table.free = list(self.free)
+        return table
+
+    def unshare(self, v: str) -> None:
+        """
+        Replaces v's neighbor array with a copy, so it can be changed without affecting a
+        table made by copy()
+        """
+        i = self.ids[v]
+        self.neighbors[i] = array('I', self.neighbors[i])
+
+    def remove_vertex(self, v: str) -> None:
+        """
+        Removes v and every edge incident to it, and frees its id for reuse
+        """
+        i = self.ids.pop(v)
+        for j in self.neighbors[i]:
+            row = self.neighbors[j]
+            del row[self._position(row, v)]
+        self.neighbors[i] = array('I')
+        self.names[i] = None
+        self.free.append(i)
+
+
+class UndirectedGraphBatch:
+    """
+    Changes to an UndirectedGraph collected inside a with block and applied when it ends:
+
+        with graph.batch() as batch:
+            batch.add_edge('A', 'B')
+            batch.remove_vertex('C')
+
+    The result is the same as making the calls on the graph in the same order, but each run
+    of consecutive calls of the same kind is applied by add_vertices(), add_edges() or
+    remove_edges(). If the block raises an exception nothing is applied
+    """
+
+    def __init__(self, graph):
+        """
+        Start with no pending changes. Each change is a (method name, arguments) pair
+        """
+        self.graph = graph
+        self.changes = []
+
+    def __enter__(self):
+        """
+        Return the batch for use in the with block
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Apply the queued changes unless the block raised an exception
+        """
+        if exc_type is None:
+            self.apply()
+        return False
+
+    def add_vertex(self, v: str) -> None:
+        """
+        Queues add_vertex(v)
+        """
+        self.changes.append(('add_vertices', v))
+
+    def add_edge(self, u: str, v: str) -> None:
+        """
+        Queues add_edge(u, v)
+        """
+        self.changes.append(('add_edges', (u, v)))
+
+    def remove_edge(self, v: str, u: str) -> None:
+        """
+        Queues remove_edge(v, u)
+        """
+        self.changes.append(('remove_edges', (v, u)))
+
+    def remove_vertex(self, v: str) -> None:
+        """
+        Queues remove_vertex(v)
+        """
+        self.changes.append(('remove_vertex', v))
+
+    def apply(self) -> None:
+        """
+        Applies the queued changes to the graph in order and clears them
+        """
+        graph = self.graph
+        i = 0
+        while i < len(self.changes):
+            method = self.changes[i][0]
+            if method == 'remove_vertex':
+                graph.remove_vertex(self.changes[i][1])
+                i += 1
+                continue
+            j = i
+            while j < len(self.changes) and self.changes[j][0] == method:
+                j += 1
+            getattr(graph, method)([argument for _, argument in self.changes[i:j]])
+            i = j
+        self.changes = []
+
 
 class UndirectedGraph:
     """
@@ -17,11 +398,44 @@ class UndirectedGraph:
     - vertex names are integers
     """
 
-    def __init__(self, start_edges=None):
+    def __init__(self, start_edges=None, storage='list', connectivity=False):
         """
-        Store graph info as adjacency list
+        Store graph info as adjacency list, with each neighbor list kept in sorted order so
+        traversals never need to sort. With storage='set' each vertex maps to a set of
+        neighbors instead, so edge add/remove/lookup are O(1) and remove_vertex() only
+        touches the removed vertex's neighbors. With storage='compact' vertex names are
+        interned as integer ids in an InternedAdjacency, so each edge costs two 4-byte ids
+        and traversals mark visited vertices in a bytearray instead of hashing names. Graphs
+        returned by load() use a read-only MappedAdjacency ('csr') until they are first
+        changed. With connectivity=True a disjoint-set forest is kept alongside the graph so
+        component counts, connected() and has_cycle() are answered without a traversal
         """
-        self.adj_list = dict()
+        if storage not in ('list', 'set', 'compact'):
+            raise ValueError(f"unknown storage '{storage}', expected 'list', 'set' or 'compact'")
+        self.storage = storage
+        self.adj_list = InternedAdjacency() if storage == 'compact' else dict()
+        #counts kept up to date by the mutating methods so they can be read in constant time
+        self.num_vertices = 0
+        self.num_edges = 0
+        #bumped by every change to the vertices or edges so derived data can be checked
+        self.version = 0
+        #(version, names, offsets, targets) built by _id_rows()
+        self._id_arrays = None
+        #sorted neighbor lists for set storage, built on demand and dropped when a vertex changes
+        self._ordered = dict()
+        #disjoint-set forest (only with connectivity=True): parent pointers, live members of
+        #each root, roots whose set may have been split by a removal, and removed vertices
+        #still referenced by parent pointers until their set is rebuilt
+        self._parent = dict() if connectivity else None
+        self._members = dict()
+        self._dirty = set()
+        self._removed = set()
+        self._components = 0
+        #collector set by enable_instrumentation(); None keeps instrumented methods on their plain path
+        self._instrumentation = None
+        #vertices whose neighbors have been copied since the last snapshot(), or None if no
+        #snapshot has been taken
+        self._owned = None
 
         # populate graph with initial vertices and edges (if provided)
         # before using, implement add_vertex() and add_edge() methods
@@ -33,7 +447,7 @@ class UndirectedGraph:
         """
         Return content of the graph in human-readable form
         """
-        out = [f'{v}: {self.adj_list[v]}' for v in self.adj_list]
+        out = [f'{v}: {self._neighbor_list(v)}' for v in self.adj_list]
         out = '\n  '.join(out)
         if len(out) < 70:
             out = out.replace('\n  ', ', ')
@@ -42,6 +456,108 @@ class UndirectedGraph:
 
     # ------------------------------------------------------------------ #
 
+    def _neighbor_list(self, v: str) -> []:
+        """
+        Returns the neighbors of v as a sorted list. For set storage this is a cached sorted
+        view, rebuilt only after an edge at v has changed
+        """
+        if self.storage != 'set':
+            return self.adj_list[v]
+        ordered = self._ordered.get(v)
+        if ordered is None:
+            ordered = sorted(self.adj_list[v])
+            self._ordered[v] = ordered
+        return ordered
+
+    def _has_edge(self, u: str, v: str) -> bool:
+        """
+        Returns True if vertex u exists and has an edge to v. Neighbor lists are sorted, so
+        list storage can use a binary search
+        """
+        if self.storage == 'compact':
+            return self.adj_list.has_edge(u, v)
+        neighbors = self.adj_list.get(u)
+        if neighbors is None:
+            return False
+        if self.storage == 'set':
+            return v in neighbors
+        i = bisect.bisect_left(neighbors, v)
+        return i < len(neighbors) and neighbors[i] == v
+
+    def _find(self, v: str) -> str:
+        """
+        Returns the root of v's set in the disjoint-set forest, halving the path as it goes
+        """
+        parent = self._parent
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    def _union(self, u: str, v: str) -> None:
+        """
+        Merges the sets containing u and v, attaching the smaller set to the larger one
+        """
+        root_u, root_v = self._find(u), self._find(v)
+        if root_u == root_v:
+            return
+        if len(self._members[root_u]) < len(self._members[root_v]):
+            root_u, root_v = root_v, root_u
+        self._parent[root_v] = root_u
+        self._members[root_u] |= self._members.pop(root_v)
+        self._components -= 1
+        #a set that may be over-merged stays suspect after absorbing another set
+        if root_v in self._dirty:
+            self._dirty.discard(root_v)
+            self._dirty.add(root_u)
+
+    def _refresh_components(self) -> None:
+        """
+        Rebuilds only the sets that a remove_edge() or remove_vertex() may have split, by
+        resetting their members to singletons and re-joining them along the remaining edges
+        """
+        if not self._dirty:
+            return
+        rebuilt = []
+        for root in self._dirty:
+            members = self._members.pop(root)
+            self._components -= 1
+            for v in members:
+                self._parent[v] = v
+                self._members[v] = {v}
+                self._components += 1
+            rebuilt.append(members)
+        self._dirty = set()
+        for members in rebuilt:
+            for v in members:
+                for neighbor in self.adj_list[v]:
+                    self._union(v, neighbor)
+        #removed vertices are no longer on any parent path once their sets are rebuilt
+        for v in self._removed:
+            del self._parent[v]
+        self._removed = set()
+
+    def _materialize(self) -> None:
+        """
+        Copies a graph loaded from a file into list storage so it can be changed
+        """
+        self.adj_list = dict(self.adj_list.items())
+        self.storage = 'list'
+        self._owned = None
+
+    def _unshare(self, *vertices) -> None:
+        """
+        Gives the graph its own copy of the neighbors of each given vertex before they are
+        changed, unless it already made one since the last snapshot()
+        """
+        for v in vertices:
+            if v not in self._owned:
+                self._owned.add(v)
+                if self.storage == 'compact':
+                    self.adj_list.unshare(v)
+                else:
+                    self.adj_list[v] = self.adj_list[v].copy()
+
     def add_vertex(self, v: str) -> None:
         """
         method adds a new vertex to the graph. Vertex names can be any string. If a vertex
@@ -49,9 +565,23 @@ class UndirectedGraph:
         """
         # if input vertex is not in dictionary, add v as the key and an empty list as the value pair
         if v not in self.adj_list:
-            self.adj_list[v] = []
+            if self.storage == 'csr':
+                self._materialize()
+            if self.storage == 'compact':
+                self.adj_list.add_vertex(v)
+            else:
+                self.adj_list[v] = [] if self.storage == 'list' else set()
+            self.num_vertices += 1
+            self.version += 1
+            if self._parent is not None:
+                #a removed vertex with the same name must be cleared from the forest first
+                if v in self._parent:
+                    self._refresh_components()
+                self._parent[v] = v
+                self._members[v] = {v}
+                self._components += 1
+
 
-        
     def add_edge(self, u: str, v: str) -> None:
         """
         Method adds a new edge to the graph, connecting the two vertices with the provided
@@ -61,18 +591,30 @@ class UndirectedGraph:
         """
         if u == v:
             return
-        #if either u or v are in the dictionary and the corresponding edge is not already listed
-        #add the edge
-        if u in self.adj_list and v not in self.adj_list[u]:
-            self.adj_list[u].append(v)
-        if v in self.adj_list and u not in self.adj_list[v]:
-            self.adj_list[v]. append(u)
-
-        #if either u or v is not in the dictionary, add them and add the corresponding edge
-        if u not in self.adj_list:
-            self.adj_list[u] = [v]
-        if v not in self.adj_list:
-            self.adj_list[v] = [u]
+        if self.storage == 'csr':
+            self._materialize()
+        #if either u or v is not in the dictionary, add them first
+        self.add_vertex(u)
+        self.add_vertex(v)
+        if self._has_edge(u, v):
+            return
+        if self._owned is not None:
+            self._unshare(u, v)
+        #add the edge in both directions, inserting into list storage at its sorted position
+        if self.storage == 'set':
+            self.adj_list[u].add(v)
+            self.adj_list[v].add(u)
+            self._ordered.pop(u, None)
+            self._ordered.pop(v, None)
+        elif self.storage == 'compact':
+            self.adj_list.add_edge(u, v)
+        else:
+            bisect.insort(self.adj_list[u], v)
+            bisect.insort(self.adj_list[v], u)
+        self.num_edges += 1
+        self.version += 1
+        if self._parent is not None:
+            self._union(u, v)
 
 
     def remove_edge(self, v: str, u: str) -> None:
@@ -83,11 +625,27 @@ class UndirectedGraph:
         """
         if v not in self.adj_list or u not in self.adj_list:
             return
-        if u not in self.adj_list[v]:
+        if not self._has_edge(v, u):
             return
+        if self.storage == 'csr':
+            self._materialize()
+        if self._owned is not None:
+            self._unshare(v, u)
+        if self.storage == 'set':
+            self.adj_list[v].discard(u)
+            self.adj_list[u].discard(v)
+            self._ordered.pop(v, None)
+            self._ordered.pop(u, None)
+        elif self.storage == 'compact':
+            self.adj_list.remove_edge(v, u)
         else:
-            self.adj_list[v].remove(u)
-            self.adj_list[u].remove(v)
+            del self.adj_list[v][bisect.bisect_left(self.adj_list[v], u)]
+            del self.adj_list[u][bisect.bisect_left(self.adj_list[u], v)]
+        self.num_edges -= 1
+        self.version += 1
+        #removing the edge may split its component; rebuild that set lazily on the next query
+        if self._parent is not None:
+            self._dirty.add(self._find(v))
 
 
     def remove_vertex(self, v: str) -> None:
@@ -97,12 +655,172 @@ class UndirectedGraph:
         """
         if v not in self.adj_list:
             return
-        del self.adj_list[v]
-        for key in self.adj_list:
-            if v in self.adj_list[key]:
-                self.adj_list[key].remove(v)
+        if self.storage == 'csr':
+            self._materialize()
+        if self._owned is not None:
+            self._unshare(*self.adj_list[v])
+        self.num_vertices -= 1
+        self.version += 1
+        if self.storage == 'compact':
+            self.num_edges -= self.adj_list.degree(v)
+        else:
+            self.num_edges -= len(self.adj_list[v])
+        if self._parent is not None:
+            root = self._find(v)
+            self._members[root].discard(v)
+            self._dirty.add(root)
+            self._removed.add(v)
+        if self.storage == 'compact':
+            self.adj_list.remove_vertex(v)
+            return
+        #set storage knows exactly which vertices hold an edge back to v
+        if self.storage == 'set':
+            for neighbor in self.adj_list.pop(v):
+                self.adj_list[neighbor].discard(v)
+                self._ordered.pop(neighbor, None)
+            self._ordered.pop(v, None)
+            return
+        #only v's neighbors hold an edge back to v; find it in each by binary search
+        for key in self.adj_list.pop(v):
+            neighbors = self.adj_list[key]
+            del neighbors[bisect.bisect_left(neighbors, v)]
+
+
+
+    def add_vertices(self, vertices) -> None:
+        """
+        Adds every vertex name in VERTICES, with the same result as calling add_vertex() for each
+        """
+        if self.storage == 'csr':
+            self._materialize()
+        for v in vertices:
+            self.add_vertex(v)
+
+
+    def add_edges(self, edges) -> None:
+        """
+        Adds every (u, v) edge in EDGES with the same result as calling add_edge() for each in
+        turn. The new neighbors of each vertex are collected first and merged into its
+        neighbor list with a single sort, instead of one sorted insert per edge
+        """
+        if self.storage == 'csr':
+            self._materialize()
+        new = dict()
+        for u, v in edges:
+            if u != v:
+                new.setdefault(u, set()).add(v)
+                new.setdefault(v, set()).add(u)
+        for v in new:
+            self.add_vertex(v)
+        #compact storage replaces the arrays it changes, so it never writes to shared ones
+        if self._owned is not None and self.storage != 'compact':
+            self._unshare(*new)
+        added = 0
+        if self.storage == 'set':
+            for v, neighbors in new.items():
+                row = self.adj_list[v]
+                before = len(row)
+                row |= neighbors
+                if len(row) != before:
+                    added += len(row) - before
+                    self._ordered.pop(v, None)
+        elif self.storage == 'compact':
+            added = self.adj_list.add_neighbors(new)
+        else:
+            for v, neighbors in new.items():
+                row = self.adj_list[v]
+                neighbors.difference_update(row)
+                if len(neighbors) != 0:
+                    added += len(neighbors)
+                    row.extend(neighbors)
+                    row.sort()
+        #every new edge was added at both of its ends
+        self.num_edges += added // 2
+        if added != 0:
+            self.version += 1
+        if self._parent is not None:
+            for u, neighbors in new.items():
+                for v in neighbors:
+                    self._union(u, v)
+
+
+    def remove_edges(self, edges) -> None:
+        """
+        Removes every (u, v) edge in EDGES with the same result as calling remove_edge() for
+        each in turn. Each neighbor list is filtered once, instead of one search and delete
+        per edge
+        """
+        gone = dict()
+        for u, v in edges:
+            if u in self.adj_list and v in self.adj_list:
+                gone.setdefault(u, set()).add(v)
+                gone.setdefault(v, set()).add(u)
+        if len(gone) == 0:
+            return
+        if self.storage == 'csr':
+            self._materialize()
+        if self._owned is not None and self.storage != 'compact':
+            self._unshare(*gone)
+        removed = 0
+        if self.storage == 'compact':
+            removed = self.adj_list.remove_neighbors(gone)
+        else:
+            for v, neighbors in gone.items():
+                row = self.adj_list[v]
+                before = len(row)
+                if self.storage == 'set':
+                    row -= neighbors
+                    self._ordered.pop(v, None)
+                else:
+                    row[:] = [u for u in row if u not in neighbors]
+                removed += before - len(row)
+        self.num_edges -= removed // 2
+        if removed != 0:
+            self.version += 1
+        #removed edges may split their components; rebuild those sets lazily on the next query
+        if self._parent is not None:
+            for v in gone:
+                self._dirty.add(self._find(v))
 
 
+    def snapshot(self):
+        """
+        Returns a read-only UndirectedGraphSnapshot of the graph as it is now. Creating it
+        only copies the vertex dictionary: the neighbor lists are shared, and this graph
+        copies a vertex's neighbors the first time it changes them after the snapshot was
+        taken. Call it from the thread that changes the graph, for example after each batch
+        of updates, and hand the snapshot to reader threads: they can use it without locks
+        while this graph keeps changing. Neighbor lists no snapshot refers to any more are
+        freed as usual. The snapshot does not keep a connectivity index
+        """
+        snapshot = UndirectedGraphSnapshot.__new__(UndirectedGraphSnapshot)
+        snapshot.__dict__.update(self.__dict__)
+        if self.storage == 'compact':
+            snapshot.adj_list = self.adj_list.copy()
+        elif self.storage != 'csr':
+            snapshot.adj_list = dict(self.adj_list)
+        #state the snapshot must not share with the live graph
+        snapshot._ordered = dict(self._ordered)
+        snapshot._parent = None
+        snapshot._members = dict()
+        snapshot._dirty = set()
+        snapshot._removed = set()
+        snapshot._components = 0
+        snapshot._instrumentation = None
+        snapshot._owned = None
+        #loaded graphs are read-only until copied by _materialize(), so share nothing to track
+        if self.storage != 'csr':
+            self._owned = set()
+        return snapshot
+
+
+    def batch(self):
+        """
+        Returns an UndirectedGraphBatch for use in a with block. Changes made through it are
+        collected and applied together when the block ends
+        """
+        return UndirectedGraphBatch(self)
+
 
     def get_vertices(self) -> []:
         """
@@ -119,15 +837,21 @@ class UndirectedGraph:
         Return list of edges in the graph (any order).  Each edge is returned as a tuple of two
         incident vertex names.
         """
-        #create edge_list. Loop through dictionary and add (vertex, edge) pairs to list
-        edge_list = []
+        return list(self.iter_edges())
+
+    def iter_edges(self):
+        """
+        Generator that yields each edge in the graph exactly once as a tuple of two incident
+        vertex names, in O(V + E) time without building a list
+        """
+        #an edge is yielded from whichever endpoint is reached first: (A, B) is the same as (B, A),
+        #so neighbors that have already been finished as keys are skipped
+        finished = set()
         for key in self.adj_list:
             for vertex in self.adj_list[key]:
-                key_value_tuple = (key, vertex)
-                #see if reverse order is already in the list: (A, B) is the same as (B, A) in this case
-                if key_value_tuple[::-1] not in edge_list:
-                    edge_list.append(key_value_tuple)
-        return edge_list
+                if vertex not in finished:
+                    yield key, vertex
+            finished.add(key)
         
 
     def is_valid_path(self, path: []) -> bool:
@@ -147,83 +871,403 @@ class UndirectedGraph:
         for i in range(len(path) - 1):
             key = path[i]
             next = path[i+1]
-            if key not in self.adj_list or next not in self.adj_list[key]:
+            if not self._has_edge(key, next):
                 return False
         return True
        
 
+    def are_valid_paths(self, paths, offsets=None) -> []:
+        """
+        Checks a batch of paths and returns a list holding is_valid_path()'s answer for each.
+        PATHS is a list of vertex name lists or, when OFFSETS is given, one flat sequence in
+        which path i is paths[offsets[i]:offsets[i + 1]]. Each step is checked in place with
+        _has_edge(), a binary search for list storage and a lookup for set and compact
+        storage, so the batch builds no neighbor sets of its own.
+        """
+        if offsets is not None:
+            flat = paths
+            paths = (flat[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1))
+        has_edge = self._has_edge
+        valid = []
+        for path in paths:
+            if len(path) == 1:
+                valid.append(path[0] in self.adj_list)
+            else:
+                valid.append(all(has_edge(u, v) for u, v in zip(path, path[1:])))
+        return valid
+
+
     def dfs(self, v_start, v_end=None) -> []:
         """
         Performs a depth-first search (DFS) in the graph and returns a list of vertices
         visited during the search, in the order they were visited.
         """
-        #create an empty stack using python list structure and a list of vertices visited
+        if self._instrumentation is not None:
+            return self._traced_traversal('dfs', self.iter_dfs, v_start, v_end)
+        return list(self.iter_dfs(v_start, v_end))
+
+
+
+    def bfs(self, v_start, v_end=None) -> []:
+        """
+        Return list of vertices visited during BFS search
+        Vertices are picked in alphabetical order
+        """
+        if self._instrumentation is not None:
+            return self._traced_traversal('bfs', self.iter_bfs, v_start, v_end)
+        return list(self.iter_bfs(v_start, v_end))
+
+
+    def _traced_traversal(self, method: str, traversal, v_start, v_end) -> []:
+        """
+        Runs dfs() or bfs() and records its counters with the instrumentation
+        """
+        start = time.perf_counter()
+        visited = list(traversal(v_start, v_end))
+        stats = CallStats(method, time.perf_counter() - start)
+        stats.vertices = len(visited)
+        #every visited vertex has its edges scanned, except v_end where the search stops
+        expanded = visited[:-1] if len(visited) != 0 and visited[-1] == v_end else visited
+        stats.edges = sum(len(self.adj_list[v]) for v in expanded)
+        self._instrumentation.record(stats)
+        return visited
+
+
+    def iter_dfs(self, v_start, v_end=None, max_depth=None):
+        """
+        Generator version of dfs() that yields vertices as they are visited, so callers can
+        stop early. If max_depth is given, vertices more than max_depth edges from v_start
+        along the search tree are not explored.
+        """
+        #create an empty stack using python list structure and a set of vertices visited
         stack = []
         if v_start not in self.adj_list:
-            return []
-        vertices_visited = []
-        stack.append(v_start)
-        #while stack length is not empty, pop a vertex, added to vertices visited (if not already visited)
+            return
+        if self.storage == 'compact':
+            yield from self._iter_interned(v_start, v_end, max_depth, True)
+            return
+        visited = set()
+        stack.append((v_start, 0))
+        #while stack length is not empty, pop a vertex and yield it (if not already visited)
         #if vertex equals end point, stop there
         while len(stack) != 0:
-            vertex = stack.pop()
-            if vertex not in vertices_visited:
-                vertices_visited.append(vertex)
+            vertex, depth = stack.pop()
+            if vertex not in visited:
+                visited.add(vertex)
+                yield vertex
                 if vertex == v_end:
-                    break
-                #sort list values so that they are added to the stack in required order
-                self.adj_list[vertex].sort(reverse=True)
-                for next_vertex in self.adj_list[vertex]:
-                    stack.append(next_vertex)
-        return vertices_visited
-
+                    return
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                #neighbors are stored sorted; push them in reverse so they are popped in required order
+                for next_vertex in reversed(self._neighbor_list(vertex)):
+                    if next_vertex not in visited:
+                        stack.append((next_vertex, depth + 1))
 
 
-    def bfs(self, v_start, v_end=None) -> []:
+    def iter_bfs(self, v_start, v_end=None, max_depth=None):
         """
-        Return list of vertices visited during BFS search
-        Vertices are picked in alphabetical order
+        Generator version of bfs() that yields vertices as they are visited, so callers can
+        stop early. If max_depth is given, vertices more than max_depth edges from v_start
+        are not explored.
         """
         #very similar to dfs except uses a queue to implement first in first out structure
         queue = deque([])
         if v_start not in self.adj_list:
-            return []
-        vertices_visited = []
-        queue.appendleft(v_start)
+            return
+        if self.storage == 'compact':
+            yield from self._iter_interned(v_start, v_end, max_depth, False)
+            return
+        #vertices are marked when queued; since the queue is first in first out this visits
+        #them in the same order as marking them when popped, without duplicate queue entries
+        visited = {v_start}
+        queue.appendleft((v_start, 0))
         while len(queue) != 0:
             #pop from the right of the queue
-            vertex = queue.pop()
-            if vertex not in vertices_visited:
-                vertices_visited.append(vertex)
-                if vertex == v_end:
-                    break
-                self.adj_list[vertex].sort()
-                for next_vertex in self.adj_list[vertex]:
-                    #use append left so that vertices are added to the queue on the left
-                    queue.appendleft(next_vertex)
-        return vertices_visited
+            vertex, depth = queue.pop()
+            yield vertex
+            if vertex == v_end:
+                return
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for next_vertex in self._neighbor_list(vertex):
+                #use append left so that vertices are added to the queue on the left
+                if next_vertex not in visited:
+                    visited.add(next_vertex)
+                    queue.appendleft((next_vertex, depth + 1))
+
+
+
+    def _iter_interned(self, v_start, v_end, max_depth, depth_first):
+        """
+        iter_dfs() and iter_bfs() for compact storage. The search runs on integer ids with a
+        bytearray of visited flags, and only the vertices it yields are turned back into names
+        """
+        adjacency = self.adj_list
+        names, rows = adjacency.names, adjacency.neighbors
+        end = adjacency.ids.get(v_end, -1)
+        visited = bytearray(len(names))
+        start = adjacency.ids[v_start]
+        if depth_first:
+            stack = [(start, 0)]
+            while len(stack) != 0:
+                vertex, depth = stack.pop()
+                if not visited[vertex]:
+                    visited[vertex] = 1
+                    yield names[vertex]
+                    if vertex == end:
+                        return
+                    if max_depth is not None and depth >= max_depth:
+                        continue
+                    for next_vertex in reversed(rows[vertex]):
+                        if not visited[next_vertex]:
+                            stack.append((next_vertex, depth + 1))
+            return
+        visited[start] = 1
+        queue = deque([(start, 0)])
+        while len(queue) != 0:
+            vertex, depth = queue.popleft()
+            yield names[vertex]
+            if vertex == end:
+                return
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for next_vertex in rows[vertex]:
+                if not visited[next_vertex]:
+                    visited[next_vertex] = 1
+                    queue.append((next_vertex, depth + 1))
+
+
+
+    def bfs_levels(self, v_start) -> dict:
+        """
+        Returns a dictionary mapping each vertex reachable from v_start to the number of edges
+        on a shortest path to it. The search goes one level at a time
+        """
+        if v_start not in self.adj_list:
+            return dict()
+        levels = {v_start: 0}
+        frontier = [v_start]
+        level = 0
+        while len(frontier) != 0:
+            level += 1
+            next_frontier = []
+            for vertex in frontier:
+                for next_vertex in self._neighbor_list(vertex):
+                    if next_vertex not in levels:
+                        levels[next_vertex] = level
+                        next_frontier.append(next_vertex)
+            frontier = next_frontier
+        return levels
+
+
+    def parallel_bfs_levels(self, v_start, processes=None) -> dict:
+        """
+        Returns the same dictionary as bfs_levels(), computed with each large frontier split
+        across a pool of PROCESSES worker processes (default: one per CPU) that share the graph
+        as integer ids in compressed-row form (see graph_parallel). The compressed rows are
+        built once per graph version and reused by later calls
+        """
+        if v_start not in self.adj_list:
+            return dict()
+        names, offsets, targets = self._id_rows()
+        start = self.adj_list.ids[v_start] if self.storage == 'compact' else names.index(v_start)
+        levels = parallel_bfs_levels(offsets, targets, start, processes)
+        return {names[i]: level for i, level in enumerate(levels) if level != -1}
+
 
+    def _id_rows(self):
+        """
+        Returns the graph as (names, offsets, targets), where vertex i is named names[i] and
+        its neighbors are the ids targets[offsets[i]] to targets[offsets[i + 1] - 1]. Loaded
+        and compact graphs already hold their neighbors as ids, so only the rows are copied.
+        The arrays are rebuilt only after the graph changes, so callers must not modify them
+        """
+        if self.storage == 'csr':
+            return self.adj_list.names, self.adj_list.offsets, self.adj_list.targets
+        if self._id_arrays is not None and self._id_arrays[0] == self.version:
+            return self._id_arrays[1:]
+        offsets = array('q', [0])
+        targets = array('q')
+        if self.storage == 'compact':
+            for row in self.adj_list.neighbors:
+                targets.extend(row.tolist())
+                offsets.append(len(targets))
+            #a copy, since the table reuses the names of removed vertices
+            names = list(self.adj_list.names)
+        else:
+            names = list(self.adj_list)
+            ids = {name: i for i, name in enumerate(names)}
+            for name in names:
+                targets.extend([ids[neighbor] for neighbor in self._neighbor_list(name)])
+                offsets.append(len(targets))
+        self._id_arrays = (self.version, names, offsets, targets)
+        return names, offsets, targets
 
 
     def count_connected_components(self):
         """
         Return number of connected components in the graph with help form the
-        depth first search (dfs) function.
+        depth first search (dfs) function, or from the connectivity index if enabled.
+        """
+        if self._instrumentation is None:
+            return self._count_components()
+        start = time.perf_counter()
+        count = self._count_components()
+        self._instrumentation.record(self._component_stats('count_connected_components', start))
+        return count
+
+
+    def _component_stats(self, method: str, start: float) -> CallStats:
         """
+        Counters for a call that counted the connected components, started at time start.
+        Without the connectivity index every vertex is visited and every edge scanned from
+        both ends; with it nothing is traversed
+        """
+        stats = CallStats(method, time.perf_counter() - start)
+        if self._parent is None:
+            stats.vertices = self.num_vertices
+            stats.edges = 2 * self.num_edges
+        return stats
+
+
+    def _count_components(self):
+        """
+        count_connected_components() without instrumentation
+        """
+        if self._parent is not None:
+            self._refresh_components()
+            return self._components
         #initialize vertices visited and count.
-        vertices_visited = []
+        vertices_visited = set()
         count = 0
-        #iterate through each vertex in dictionary. If it isn't in the visited list, perform dfs, then add
-        #all vertices visited from dfs to the vertices_visited list and increase count.
+        #iterate through each vertex in dictionary. If it isn't in the visited set, perform dfs, then add
+        #all vertices visited from dfs to the vertices_visited set and increase count.
         for vertex in self.adj_list:
             if vertex not in vertices_visited:
-                vertices = self.dfs(vertex)
                 count += 1
-                for item in vertices:
-                    vertices_visited.append(item)
+                vertices_visited.update(self.iter_dfs(vertex))
         return count
+
+
+    def connected(self, u: str, v: str) -> bool:
+        """
+        Return True if u and v are both in the graph and there is a path between them.
+        """
+        if u not in self.adj_list or v not in self.adj_list:
+            return False
+        if self._parent is not None:
+            self._refresh_components()
+            return self._find(u) == self._find(v)
+        return v in self.iter_bfs(u, v)
       
 
+    def enable_instrumentation(self, callback=None) -> None:
+        """
+        Turns on per-call counters for dfs(), bfs(), count_connected_components() and
+        has_cycle(). After each call a CallStats is passed to callback (if given) and added to
+        the totals returned by instrumentation_info(). When instrumentation is off each of
+        these methods only pays for one attribute check.
+        """
+        self._instrumentation = Instrumentation(callback)
+
+
+    def disable_instrumentation(self) -> None:
+        """
+        Turns instrumentation off and drops its totals
+        """
+        self._instrumentation = None
+
+
+    def instrumentation_info(self):
+        """
+        Returns the per-method totals as a dictionary, or None if instrumentation is off
+        """
+        if self._instrumentation is None:
+            return None
+        return self._instrumentation.info()
+
+
+    def save(self, path: str) -> None:
+        """
+        Writes the graph to path in the binary format of graph_io: a sorted table of vertex
+        names (which must be strings) and compressed rows of neighbor ids, which load() can
+        memory-map
+        """
+        names = sorted(self.adj_list)
+        ids = {name: i for i, name in enumerate(names)}
+        offsets = array('q', [0])
+        targets = array('q')
+        for name in names:
+            targets.extend(sorted(ids[neighbor] for neighbor in self.adj_list[name]))
+            offsets.append(len(targets))
+        write_graph(path, 1, offsets, targets, names=names)
+
+
+    @classmethod
+    def from_edgelist(cls, source, chunk_size=100000, storage='list', connectivity=False):
+        """
+        Builds a graph from an edge list file (or iterable of lines) with one 'u v' edge per
+        line, separated by whitespace or commas. Lines are read chunk_size at a time into
+        neighbor sets, and the final storage is built once at the end instead of calling
+        add_edge() per item. Compact storage skips the neighbor sets: each chunk's names are
+        interned and their ids appended to the rows straight away, and each row is sorted
+        once at the end. As with add_edge(), loops and repeated edges are skipped. Lines
+        that do not hold exactly two names raise ValueError.
+        """
+        graph = cls(storage=storage, connectivity=connectivity)
+        neighbors = dict()
+        for chunk in iter_edge_chunks(source, chunk_size):
+            for line_number, fields in chunk:
+                if len(fields) != 2:
+                    raise ValueError(f'line {line_number}: cannot parse edge {fields}')
+            if storage == 'compact':
+                graph.adj_list.append_edges(fields for _, fields in chunk)
+                continue
+            for _, (u, v) in chunk:
+                if u != v:
+                    neighbors.setdefault(u, set()).add(v)
+                    neighbors.setdefault(v, set()).add(u)
+        if storage == 'compact':
+            graph.num_edges = graph.adj_list.sort_rows()
+            neighbors = graph.adj_list
+        else:
+            if storage == 'set':
+                graph.adj_list = neighbors
+            else:
+                graph.adj_list = {v: sorted(neighbors[v]) for v in neighbors}
+            graph.num_edges = sum(len(adjacent) for adjacent in neighbors.values()) // 2
+        graph.num_vertices = len(neighbors)
+        if connectivity:
+            for v in neighbors:
+                graph._parent[v] = v
+                graph._members[v] = {v}
+            graph._components = len(neighbors)
+            for u in neighbors:
+                for v in neighbors[u]:
+                    graph._union(u, v)
+        return graph
+
+
+    @classmethod
+    def load(cls, path: str, mmap=True):
+        """
+        Reads a graph written by save(). With mmap=True the arrays and name table are views
+        of the memory-mapped file, so loading is near-instant and processes loading the same
+        file share one read-only copy. The graph is copied into list storage the first time it
+        is changed.
+        """
+        data = read_graph(path, use_mmap=mmap)
+        if data['kind'] != 1:
+            raise ValueError(f'{path} does not hold an undirected graph')
+        graph = cls()
+        graph.storage = 'csr'
+        graph.adj_list = MappedAdjacency(data['names'], data['offsets'], data['targets'])
+        graph.num_vertices = data['v_count']
+        graph.num_edges = len(data['targets']) // 2
+        return graph
+
+
     def has_cycle(self):
         """
         Return True if graph contains a cycle, False otherwise.
@@ -232,15 +1276,39 @@ class UndirectedGraph:
         #have edges = number of vertices -1
         #in this case, since there are often multiple connected graphs, the equation is modified to
         # edges = vertices - connected components
-        connected_components = self.count_connected_components()
-        vertices = len(self.get_vertices())
-        edges = len(self.get_edges())
+        if self._instrumentation is not None:
+            start = time.perf_counter()
+        connected_components = self._count_components()
+        if self._instrumentation is not None:
+            self._instrumentation.record(self._component_stats('has_cycle', start))
+        vertices = self.num_vertices
+        edges = self.num_edges
         if edges == vertices - connected_components:
             return False
         return True
-       
 
-   
+
+class UndirectedGraphSnapshot(UndirectedGraph):
+    """
+    Read-only view of an UndirectedGraph as it was when UndirectedGraph.snapshot() was
+    called. All query methods work as on the graph itself; methods that would change it
+    raise TypeError
+    """
+
+    def _read_only(self, *args, **kwargs):
+        """
+        Raise TypeError in place of any method that would change the graph
+        """
+        raise TypeError('graph snapshots are read-only')
+
+    add_vertex = add_vertices = add_edge = remove_edge = remove_vertex = _read_only
+    add_edges = remove_edges = batch = _read_only
+
+    def snapshot(self):
+        """
+        A snapshot never changes, so it is its own snapshot
+        """
+        return self
 
 
 if __name__ == '__main__':